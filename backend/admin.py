@@ -1,11 +1,24 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.db.models import F
 
 from backend.models import User, Shop, Category, Product, ProductInfo, \
     Parameter, ProductParameter, Order, OrderItem, \
-    Contact, ConfirmEmailToken
+    Contact, ConfirmEmailToken, ImportJob, CatalogEntry
 
 from backend.signals import new_order_status
+from backend.stock import update_order_totals
+from backend.catalog import refresh_catalog_entries, refresh_shop_entries, \
+    bump_shop_versions
+
+
+def catalog_changed(product_info_ids):
+    """
+    Переносит правки из админки в витрину каталога и выгрузки магазинов.
+    """
+    product_info_ids = list(product_info_ids)
+    refresh_catalog_entries(product_info_ids)
+    bump_shop_versions(product_info_ids)
 
 
 @admin.register(User)
@@ -49,6 +62,12 @@ class ShopAdmin(admin.ModelAdmin):
     list_display = ('name', 'url', 'user')
     search_fields = ('name', )
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        refresh_shop_entries(obj)
+        Shop.objects.filter(id=obj.id).update(
+            catalog_version=F('catalog_version') + 1)
+
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -59,6 +78,11 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name',)
     search_fields = ('name',)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        catalog_changed(CatalogEntry.objects.filter(
+            category_id=obj.id).values_list('pk', flat=True))
+
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
@@ -70,6 +94,11 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ('category',)
     search_fields = ('name',)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        catalog_changed(CatalogEntry.objects.filter(
+            product_id=obj.id).values_list('pk', flat=True))
+
 
 @admin.register(ProductInfo)
 class ProductInfoAdmin(admin.ModelAdmin):
@@ -77,10 +106,15 @@ class ProductInfoAdmin(admin.ModelAdmin):
     Панель управления информацией о товарах (цена, количество и т.д.).
     Отвечает за отображение, фильтрацию и поиск.
     """
-    list_display = ('product', 'shop', 'price', 'quantity', 'external_id')
-    list_filter = ('shop', 'product')
+    list_display = ('product', 'shop', 'price', 'quantity', 'external_id',
+                    'archived')
+    list_filter = ('shop', 'product', 'archived')
     search_fields = ('product__name', 'shop__name')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        catalog_changed([obj.id])
+
 
 @admin.register(Parameter)
 class ParameterAdmin(admin.ModelAdmin):
@@ -91,6 +125,11 @@ class ParameterAdmin(admin.ModelAdmin):
     list_display = ('name',)
     search_fields = ('name',)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        catalog_changed(ProductParameter.objects.filter(
+            parameter=obj).values_list('product_info_id', flat=True))
+
 
 @admin.register(ProductParameter)
 class ProductParameterAdmin(admin.ModelAdmin):
@@ -102,6 +141,14 @@ class ProductParameterAdmin(admin.ModelAdmin):
     list_filter = ('parameter',)
     search_fields = ('parameter__name', 'value')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        catalog_changed([obj.product_info_id])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        catalog_changed([obj.product_info_id])
+
 
 class OrderItemInline(admin.TabularInline):
     """
@@ -118,7 +165,7 @@ class OrderAdmin(admin.ModelAdmin):
     Позволяет просматривать, фильтровать, искать и редактировать заказы.
     Отслеживает изменения статуса заказа и отправляет сигнал.
     """
-    list_display = ('id', 'user', 'status', 'dt')
+    list_display = ('id', 'user', 'status', 'dt', 'total_sum')
     list_filter = ('status', 'dt')
     search_fields = ('user__email',)
     inlines = [OrderItemInline]
@@ -140,6 +187,11 @@ class OrderAdmin(admin.ModelAdmin):
                 new_order_status.send(sender=self.__class__, order=obj)
         super().save_queryset(request, queryset)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if form.instance.status != 'basket':
+            update_order_totals(form.instance.id)
+
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
@@ -147,10 +199,32 @@ class OrderItemAdmin(admin.ModelAdmin):
     Панель управления позициями заказов.
     Позволяет просматривать, фильтровать и искать позиции заказов.
     """
-    list_display = ('order', 'product', 'quantity', 'shop')
+    list_display = ('order', 'product', 'quantity', 'price', 'shop')
     list_filter = ('order', 'shop')
     search_fields = ('product__product__name', 'shop__name')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if obj.order.status != 'basket':
+            update_order_totals(obj.order_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        if obj.order.status != 'basket':
+            update_order_totals(obj.order_id)
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    """
+    Панель просмотра задач импорта прайс-листов.
+    Показывает состояние, прогресс и ошибки импорта.
+    """
+    list_display = ('id', 'shop', 'state', 'goods_processed', 'goods_total',
+                    'created_at', 'finished_at')
+    list_filter = ('state',)
+    search_fields = ('url', 'shop__name', 'user__email')
+
 
 @admin.register(Contact)
 class ContactAdmin(admin.ModelAdmin):
@@ -0,0 +1,73 @@
+from django.db import connection
+
+from backend.models import ProductInfo
+
+# Наибольшее число строк в одном запросе добавления в корзину
+MAX_BASKET_LINES = 500
+
+# Строки корзины добавляются одним запросом. Если товар уже лежит
+# в корзине, его количество увеличивается на добавленное
+ADD_LINES_SQL = """
+    INSERT INTO backend_orderitem (order_id, product_id, shop_id, quantity)
+    SELECT %(order)s, line.product_id, line.shop_id, line.quantity
+    FROM unnest(%(products)s::bigint[], %(shops)s::bigint[],
+                %(quantities)s::integer[])
+        AS line (product_id, shop_id, quantity)
+    ON CONFLICT (order_id, product_id) DO UPDATE
+    SET quantity = backend_orderitem.quantity + EXCLUDED.quantity
+"""
+
+
+def parse_lines(data):
+    """
+    Строки корзины из запроса: список items с product_info_id и quantity
+    или одна строка в полях самого запроса. Повторы одного товара
+    складываются. При некорректных данных выбрасывает ValueError.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Тело запроса должно быть объектом')
+    lines = data.get('items')
+    if lines is None:
+        lines = [data]
+    if not isinstance(lines, list) or not lines:
+        raise ValueError('items должен быть непустым списком')
+    if len(lines) > MAX_BASKET_LINES:
+        raise ValueError(f'Не больше {MAX_BASKET_LINES} строк за раз')
+
+    quantities = {}
+    for line in lines:
+        if not isinstance(line, dict) or not line.get('product_info_id') \
+                or not line.get('quantity'):
+            raise ValueError('product_info_id и quantity обязательны')
+        try:
+            product_info_id = int(line['product_info_id'])
+            quantity = int(line['quantity'])
+        except (TypeError, ValueError):
+            raise ValueError('product_info_id и quantity должны быть числами')
+        if quantity <= 0:
+            raise ValueError('Количество должно быть положительным числом')
+        quantities[product_info_id] = \
+            quantities.get(product_info_id, 0) + quantity
+    return quantities
+
+
+def add_to_basket(basket, quantities):
+    """
+    Добавляет товары в корзину: проверяет все позиции одним запросом
+    и записывает строки одним INSERT ... ON CONFLICT. Если каких-то
+    позиций нет, выбрасывает ValueError и ничего не добавляет.
+    """
+    shops = dict(ProductInfo.objects.filter(
+        id__in=quantities, archived=False).values_list('id', 'shop_id'))
+    missing = sorted(set(quantities) - set(shops))
+    if missing:
+        raise ValueError(
+            f'Продукт не найден: {", ".join(map(str, missing))}')
+
+    products = list(quantities)
+    with connection.cursor() as cursor:
+        cursor.execute(ADD_LINES_SQL, {
+            'order': basket.id,
+            'products': products,
+            'shops': [shops[product] for product in products],
+            'quantities': [quantities[product] for product in products]})
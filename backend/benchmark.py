@@ -0,0 +1,461 @@
+import csv
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from threading import Event, Thread
+
+import django
+from django.db import connection
+
+# Магазин, категории и параметры синтетических каталогов.
+# Имена и id выбраны так, чтобы не пересекаться с настоящими прайс-листами
+BENCH_SHOP = 'Бенчмарк'
+BENCH_EMAIL = 'benchmark@example.com'
+BENCH_CATEGORIES = {
+    9000000 + number: name for number, name in enumerate(
+        ['Смартфоны', 'Аксессуары', 'Flash-накопители', 'Телевизоры',
+         'Ноутбуки', 'Планшеты', 'Наушники', 'Мониторы'], start=1)}
+BENCH_PARAMETER_PREFIX = 'Бенчмарк: '
+# Покупатели бенчмарка оформления заказов
+BENCH_BUYERS_DOMAIN = 'checkout.benchmark.example.com'
+COLORS = ['черный', 'белый', 'синий', 'красный', 'золотистый', 'серебристый']
+
+# Расширения файлов по форматам прайс-листов
+FILE_EXTENSIONS = {'yaml': '.yaml', 'json': '.json',
+                   'ndjson': '.ndjson', 'csv': '.csv'}
+
+
+def parameter_names(count):
+    return [f'{BENCH_PARAMETER_PREFIX}параметр {number}'
+            for number in range(1, count + 1)]
+
+
+def generate_goods(count, parameters=4, seed=0, changed=0.0):
+    """
+    Генерирует товары в формате shop.yaml. При одном seed товары
+    совпадают, а changed - доля товаров с изменённой ценой.
+    """
+    rnd = random.Random(seed)
+    change = random.Random(seed + 1)
+    names = parameter_names(parameters)
+    categories = list(BENCH_CATEGORIES)
+    for number in range(1, count + 1):
+        category = rnd.choice(categories)
+        price = rnd.randrange(1000, 200000, 10)
+        if changed and change.random() < changed:
+            price += 10
+        values = {}
+        for index, name in enumerate(names):
+            if index % 3 == 0:
+                values[name] = rnd.choice(COLORS)
+            elif index % 3 == 1:
+                values[name] = rnd.choice([64, 128, 256, 512])
+            else:
+                values[name] = round(rnd.uniform(4, 80), 1)
+        yield {
+            'id': number,
+            'category': category,
+            'model': f'bench/{category}/{number % 500}',
+            'name': f'Товар {BENCH_CATEGORIES[category]} {number % 5000}',
+            'price': price,
+            'price_rrc': price + rnd.randrange(0, 10000, 10),
+            'quantity': rnd.randrange(0, 50),
+            'parameters': values,
+        }
+
+
+def write_catalog(path, count, parameters=4, catalog_format='yaml', seed=0,
+                  changed=0.0):
+    """
+    Записывает синтетический прайс-лист потоково, не держа его в памяти.
+    """
+    goods = generate_goods(count, parameters, seed, changed)
+    categories = [{'id': category_id, 'name': name}
+                  for category_id, name in BENCH_CATEGORIES.items()]
+
+    def quote(value):
+        return json.dumps(value, ensure_ascii=False)
+
+    with open(path, 'w', encoding='utf-8', newline='') as out:
+        if catalog_format == 'yaml':
+            out.write(f'shop: {quote(BENCH_SHOP)}\ncategories:\n')
+            for category in categories:
+                out.write(f'  - id: {category["id"]}\n'
+                          f'    name: {quote(category["name"])}\n')
+            out.write('goods:\n')
+            for item in goods:
+                out.write(f'  - id: {item["id"]}\n'
+                          f'    category: {item["category"]}\n'
+                          f'    model: {quote(item["model"])}\n'
+                          f'    name: {quote(item["name"])}\n'
+                          f'    price: {item["price"]}\n'
+                          f'    price_rrc: {item["price_rrc"]}\n'
+                          f'    quantity: {item["quantity"]}\n'
+                          f'    parameters:\n')
+                for name, value in item['parameters'].items():
+                    out.write(f'      {quote(name)}: {quote(value)}\n')
+        elif catalog_format == 'json':
+            out.write(f'{{"shop": {quote(BENCH_SHOP)}, '
+                      f'"categories": {quote(categories)}, "goods": [\n')
+            for number, item in enumerate(goods):
+                out.write((',\n' if number else '') + quote(item))
+            out.write('\n]}\n')
+        elif catalog_format == 'ndjson':
+            out.write(quote({'shop': BENCH_SHOP,
+                             'categories': categories}) + '\n')
+            for item in goods:
+                out.write(quote(item) + '\n')
+        elif catalog_format == 'csv':
+            names = parameter_names(parameters)
+            writer = csv.writer(out)
+            writer.writerow(['id', 'category', 'category_name', 'model',
+                             'name', 'price', 'price_rrc', 'quantity',
+                             'shop'] + [f'param:{name}' for name in names])
+            for item in goods:
+                writer.writerow(
+                    [item['id'], item['category'],
+                     BENCH_CATEGORIES[item['category']], item['model'],
+                     item['name'], item['price'], item['price_rrc'],
+                     item['quantity'], BENCH_SHOP] +
+                    [item['parameters'][name] for name in names])
+        else:
+            raise ValueError(f'Неизвестный формат: {catalog_format}')
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_directory(directory):
+    """
+    Запускает HTTP-сервер в фоне, чтобы do_import скачивал каталоги
+    так же, как прайс-листы партнёров.
+    """
+    server = ThreadingHTTPServer(
+        ('127.0.0.1', 0), partial(QuietHandler, directory=directory))
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_user():
+    from backend.models import User
+
+    user, _ = User.objects.get_or_create(
+        email=BENCH_EMAIL,
+        defaults={'username': 'benchmark', 'type': 'shop',
+                  'is_active': False})
+    return user
+
+
+def cleanup():
+    """
+    Удаляет магазин, покупателей, категории (вместе с товарами)
+    и параметры бенчмарка.
+    """
+    from backend.models import Category, Parameter, User
+
+    User.objects.filter(email=BENCH_EMAIL).delete()
+    User.objects.filter(email__endswith=f'@{BENCH_BUYERS_DOMAIN}').delete()
+    Category.objects.filter(id__in=BENCH_CATEGORIES).delete()
+    Parameter.objects.filter(
+        name__startswith=BENCH_PARAMETER_PREFIX).delete()
+
+
+def start_workers(concurrency):
+    """
+    Запускает воркер Celery с concurrency процессами и ждёт, пока он
+    начнёт принимать задачи. Очередь перед запуском очищается.
+    """
+    worker = subprocess.Popen(
+        [sys.executable, '-m', 'celery', '-A', 'orders', 'worker',
+         '--concurrency', str(concurrency), '--loglevel', 'INFO', '--purge',
+         '--without-gossip', '--without-mingle', '--without-heartbeat'],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    ready = Event()
+
+    def watch():
+        # Вывод читается до конца, чтобы воркер не встал на полном канале
+        for line in worker.stdout:
+            if ' ready.' in line:
+                ready.set()
+        ready.set()
+
+    Thread(target=watch, daemon=True).start()
+    ready.wait()
+    if worker.poll() is not None:
+        raise RuntimeError('Воркер Celery не запустился')
+    return worker
+
+
+def wait_job(job, interval=0.05):
+    """
+    Ждёт, пока воркеры закончат параллельный импорт.
+    """
+    while job.state not in ('done', 'skipped', 'failed'):
+        time.sleep(interval)
+        job.refresh_from_db()
+    if job.state == 'failed':
+        raise RuntimeError(f'Импорт не удался: {job.error}')
+
+
+def run_case(url, user_id, parallel=False):
+    """
+    Выполняет do_import (или do_parallel_import с ожиданием воркеров)
+    в отдельном процессе и замеряет время, число запросов к базе и
+    пиковый объём памяти процесса. При параллельном импорте запросы
+    и память считаются только у загрузчика, без воркеров.
+    """
+    from backend.models import ImportJob
+    from backend.tasks import do_import, do_parallel_import
+
+    queries = 0
+
+    def count_queries(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    job = ImportJob.objects.create(user_id=user_id, url=url)
+    with connection.execute_wrapper(count_queries):
+        start = time.perf_counter()
+        if parallel:
+            result = do_parallel_import(url, user_id, job.id)
+            job.refresh_from_db()
+            wait_job(job)
+        else:
+            result = do_import(url, user_id, job.id)
+        wall_time = time.perf_counter() - start
+    job.refresh_from_db()
+    return {
+        'result': result,
+        'wall_time': wall_time,
+        'queries': queries,
+        'peak_rss_mb': resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'phases': {'fetch': job.fetch_time,
+                   'parse': job.parse_time,
+                   'resolve': job.resolve_time,
+                   'write': job.write_time,
+                   'publish': job.publish_time},
+    }
+
+
+def run_scenario(directory, base_url, size, parameters, catalog_format,
+                 scenario, share, user_id, workers=None):
+    """
+    Записывает прайс-лист сценария и загружает его в новом процессе.
+    """
+    name = f'bench-{size}-{scenario}{FILE_EXTENSIONS[catalog_format]}'
+    write_catalog(os.path.join(directory, name), size, parameters,
+                  catalog_format, changed=share)
+    # Соединение не должно переходить в дочерний процесс
+    connection.close()
+    with ProcessPoolExecutor(
+            max_workers=1, mp_context=get_context('spawn'),
+            initializer=django.setup) as pool:
+        case = pool.submit(run_case, base_url + name, user_id,
+                           bool(workers)).result()
+    rows = size * (1 + parameters)
+    case.update({
+        'goods': size,
+        'scenario': scenario,
+        'workers': workers,
+        'rows': rows,
+        'goods_per_second': size / case['wall_time'],
+        'rows_per_second': rows / case['wall_time'],
+    })
+    return case
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(directory, sizes, parameters=4, catalog_format='yaml',
+                  changed=0.01, report=print, workers=None):
+    """
+    Для каждого размера каталога выполняет два сценария: загрузку в пустой
+    магазин (initial) и повторную загрузку с изменёнными ценами у доли
+    changed товаров (update). Каждый запуск идёт в новом процессе,
+    чтобы пиковая память не накапливалась между запусками.
+    workers - список количеств процессов воркера Celery: для каждого
+    сценарии повторяются с параллельным импортом. Воркеры берут брокер
+    из настроек и не должны работать в режиме task_always_eager.
+    """
+    server = serve_directory(directory)
+    base_url = f'http://127.0.0.1:{server.server_address[1]}/'
+    results = []
+    try:
+        for size in sizes:
+            for concurrency in workers or [None]:
+                cleanup()
+                user_id = bench_user().id
+                worker = None
+                if concurrency:
+                    worker = start_workers(concurrency)
+                try:
+                    for scenario, share in [('initial', 0.0),
+                                            ('update', changed)]:
+                        case = run_scenario(
+                            directory, base_url, size, parameters,
+                            catalog_format, scenario, share, user_id,
+                            concurrency)
+                        results.append(case)
+                        report(case)
+                finally:
+                    if worker is not None:
+                        worker.terminate()
+                        worker.wait()
+    finally:
+        server.shutdown()
+        cleanup()
+
+    return {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision': git_revision(),
+        'django': django.get_version(),
+        'format': catalog_format,
+        'parameters': parameters,
+        'changed': changed,
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+
+
+def prepare_checkout(buyers, stock, quantity=1):
+    """
+    Создаёт один товар с остатком stock и buyers покупателей, у каждого
+    в корзине quantity штук этого товара. Возвращает id позиции и корзин.
+    """
+    from backend.catalog import refresh_catalog_entries
+    from backend.models import Category, Order, OrderItem, Product, \
+        ProductInfo, Shop, User
+
+    shop = Shop.objects.create(name=BENCH_SHOP, user=bench_user())
+    category_id = min(BENCH_CATEGORIES)
+    category = Category.objects.create(
+        id=category_id, name=BENCH_CATEGORIES[category_id])
+    product = Product.objects.create(name='Товар бенчмарка',
+                                     category=category)
+    info = ProductInfo.objects.create(
+        product=product, shop=shop, external_id=1, model='bench/checkout',
+        quantity=stock, price=1000, price_rrc=1000)
+    refresh_catalog_entries([info.id])
+
+    users = User.objects.bulk_create([
+        User(email=f'buyer{number}@{BENCH_BUYERS_DOMAIN}',
+             username=f'buyer{number}')
+        for number in range(buyers)])
+    orders = Order.objects.bulk_create([
+        Order(user=user, status='basket') for user in users])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=info, shop=shop, quantity=quantity)
+        for order in orders])
+    return info.id, [order.id for order in orders]
+
+
+def run_checkouts(order_ids, start_at):
+    """
+    Оформляет корзины по очереди в отдельном процессе. Все процессы
+    начинают одновременно в момент start_at.
+    """
+    from backend.models import Order
+    from backend.stock import confirm_order
+
+    orders = list(Order.objects.filter(id__in=order_ids))
+    time.sleep(max(start_at - time.time(), 0))
+    confirmed = 0
+    latencies = []
+    for order in orders:
+        start = time.perf_counter()
+        try:
+            confirm_order(order)
+            confirmed += 1
+        except ValueError:
+            pass
+        latencies.append(time.perf_counter() - start)
+    return {'confirmed': confirmed, 'latencies': latencies,
+            'finished_at': time.time()}
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def run_checkout_benchmark(buyers=1000, workers=8, stock=None, quantity=1):
+    """
+    Оформляет корзины buyers покупателей на один и тот же товар
+    из workers процессов одновременно и замеряет пропускную способность.
+    По умолчанию остатка хватает половине покупателей, так что часть
+    заказов получает отказ. В конце проверяет, что товар не продан
+    сверх остатка и что витрина каталога показывает тот же остаток.
+    """
+    from django.conf import settings
+
+    from backend.models import CatalogEntry, ProductInfo
+
+    if stock is None:
+        stock = buyers * quantity // 2
+    cleanup()
+    try:
+        product_info_id, order_ids = prepare_checkout(buyers, stock,
+                                                      quantity)
+        # Соединение не должно переходить в дочерние процессы
+        connection.close()
+        with ProcessPoolExecutor(
+                max_workers=workers, mp_context=get_context('spawn'),
+                initializer=django.setup) as pool:
+            start_at = time.time() + 3
+            futures = [pool.submit(run_checkouts, order_ids[index::workers],
+                                   start_at)
+                       for index in range(workers)]
+            wait(futures)
+        parts = [future.result() for future in futures]
+
+        wall_time = max(part['finished_at'] for part in parts) - start_at
+        confirmed = sum(part['confirmed'] for part in parts)
+        latencies = [latency for part in parts
+                     for latency in part['latencies']]
+        left = ProductInfo.objects.get(id=product_info_id).quantity
+        catalog_left = CatalogEntry.objects.get(
+            product_info_id=product_info_id).quantity
+    finally:
+        cleanup()
+
+    return {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision': git_revision(),
+        'django': django.get_version(),
+        'reserve_stock': settings.RESERVE_STOCK,
+        'buyers': buyers,
+        'workers': workers,
+        'stock': stock,
+        'quantity': quantity,
+        'confirmed': confirmed,
+        'rejected': buyers - confirmed,
+        'wall_time': wall_time,
+        'checkouts_per_second': buyers / wall_time,
+        'latency_ms': {'p50': percentile(latencies, 0.5) * 1000,
+                       'p95': percentile(latencies, 0.95) * 1000,
+                       'max': max(latencies) * 1000},
+        'stock_left': left,
+        'catalog_stock_left': catalog_left,
+        'oversold': left < 0 or left != stock - confirmed * quantity,
+    }
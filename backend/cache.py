@@ -0,0 +1,106 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+# Ключи кеша: номер версии каталога и счётчики попаданий и промахов
+VERSION_KEY = 'catalog:version'
+HITS_KEY = 'catalog:hits'
+MISSES_KEY = 'catalog:misses'
+
+
+def catalog_version():
+    """
+    Возвращает текущую версию каталога. Если ключ пропал из кеша,
+    версия начинается заново с текущего времени, а не с единицы,
+    чтобы не совпасть со старыми закешированными ответами.
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Меняет версию каталога: все закешированные ответы становятся
+    недействительными. Внутри транзакции срабатывает после её фиксации,
+    иначе в кеш могли бы попасть ещё не опубликованные данные.
+    """
+    def bump():
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+    transaction.on_commit(bump)
+
+
+def count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def cache_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {'version': catalog_version(),
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / total if total else None}
+
+
+def catalog_etag(request, *args, **kwargs):
+    """
+    ETag ответов каталога: версия каталога и формат ответа.
+    Вычисляется без запросов к базе.
+    """
+    return f'catalog-{catalog_version()}-{request.accepted_renderer.format}'
+
+
+def response_key(request):
+    """
+    Ключ ответа: версия каталога, хост, путь и параметры запроса
+    (без учёта их порядка).
+    """
+    query = sorted(request.query_params.lists())
+    digest = hashlib.md5(
+        f'{request.get_host()}{request.path}{query}'.encode()).hexdigest()
+    return f'catalog:{catalog_version()}:{digest}'
+
+
+def cache_catalog_response(method):
+    """
+    Кеширует готовый JSON ответа метода APIView до смены версии каталога.
+    При попадании ответ отдаётся без запросов к базе и сериализации.
+    """
+    @wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return method(view, request, *args, **kwargs)
+
+        key = response_key(request)
+        content = cache.get(key)
+        if content is not None:
+            count(HITS_KEY)
+            response = HttpResponse(content,
+                                    content_type='application/json')
+            response['X-Cache'] = 'HIT'
+            return response
+
+        count(MISSES_KEY)
+        response = method(view, request, *args, **kwargs)
+        if response.status_code == 200:
+            response.add_post_render_callback(
+                lambda rendered: cache.set(key, rendered.content,
+                                           settings.CATALOG_CACHE_TIMEOUT))
+        response['X-Cache'] = 'MISS'
+        return response
+    return wrapper
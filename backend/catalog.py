@@ -0,0 +1,117 @@
+from django.db import connection
+from django.db.models import F
+
+from backend.cache import bump_catalog_version
+from backend.models import CatalogEntry, Shop
+
+# Размер пачки при обновлении витрины каталога
+REFRESH_BATCH_SIZE = 1000
+# Конфигурация полнотекстового поиска PostgreSQL
+SEARCH_CONFIG = 'russian'
+
+# Строки витрины собираются из ProductInfo, Product, Category, Shop и
+# параметров одним запросом на пачку. Поисковый документ: название товара
+# (вес A), модель и категория (вес B), значения параметров (вес C)
+CATALOG_SELECT_SQL = """
+    SELECT info.id, info.product_id, product.name, product.category_id,
+           category.name, info.shop_id, shop.name, shop.accepting_orders,
+           info.model, info.quantity, info.price, info.price_rrc,
+           doc.parameters,
+           concat_ws(' ', product.name, doc.details, doc.parameter_values),
+           setweight(to_tsvector(%(config)s::regconfig, product.name),
+                     'A') ||
+           setweight(to_tsvector(%(config)s::regconfig, doc.details),
+                     'B') ||
+           setweight(to_tsvector(%(config)s::regconfig,
+                                 doc.parameter_values), 'C')
+    FROM backend_productinfo AS info
+    JOIN backend_product AS product ON product.id = info.product_id
+    JOIN backend_category AS category ON category.id = product.category_id
+    JOIN backend_shop AS shop ON shop.id = info.shop_id
+    CROSS JOIN LATERAL (
+        SELECT concat_ws(' ', info.model, category.name) AS details,
+               coalesce(jsonb_object_agg(parameter.name, value.value),
+                        '{}') AS parameters,
+               coalesce(string_agg(value.value, ' ' ORDER BY value.id),
+                        '') AS parameter_values
+        FROM backend_productparameter AS value
+        JOIN backend_parameter AS parameter
+            ON parameter.id = value.parameter_id
+        WHERE value.product_info_id = info.id
+    ) AS doc
+"""
+
+CATALOG_COLUMNS = """
+    product_info_id, product_id, product_name, category_id, category_name,
+    shop_id, shop_name, accepting_orders, model, quantity, price, price_rrc,
+    parameters, search_document, search_vector
+"""
+
+REFRESH_SQL = f"""
+    INSERT INTO backend_catalogentry ({CATALOG_COLUMNS})
+    {CATALOG_SELECT_SQL}
+    WHERE info.id = ANY(%(ids)s)
+      AND NOT info.archived
+    ON CONFLICT (product_info_id) DO UPDATE SET
+        product_id = EXCLUDED.product_id,
+        product_name = EXCLUDED.product_name,
+        category_id = EXCLUDED.category_id,
+        category_name = EXCLUDED.category_name,
+        shop_id = EXCLUDED.shop_id,
+        shop_name = EXCLUDED.shop_name,
+        accepting_orders = EXCLUDED.accepting_orders,
+        model = EXCLUDED.model,
+        quantity = EXCLUDED.quantity,
+        price = EXCLUDED.price,
+        price_rrc = EXCLUDED.price_rrc,
+        parameters = EXCLUDED.parameters,
+        search_document = EXCLUDED.search_document,
+        search_vector = EXCLUDED.search_vector
+"""
+
+# Архивные позиции убираются из витрины
+REMOVE_ARCHIVED_SQL = """
+    DELETE FROM backend_catalogentry AS entry
+    USING backend_productinfo AS info
+    WHERE info.id = entry.product_info_id
+      AND info.id = ANY(%(ids)s)
+      AND info.archived
+"""
+
+
+def refresh_catalog_entries(product_info_ids):
+    """
+    Пересобирает строки витрины каталога для указанных позиций и меняет
+    версию каталога. Одна пачка обновляется одним запросом
+    INSERT ... ON CONFLICT. Строки удалённых позиций удаляются каскадом
+    вместе с ProductInfo, строки архивных - здесь.
+    """
+    product_info_ids = list(product_info_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_info_ids), REFRESH_BATCH_SIZE):
+            ids = product_info_ids[start:start + REFRESH_BATCH_SIZE]
+            cursor.execute(REFRESH_SQL, {'config': SEARCH_CONFIG,
+                                         'ids': ids})
+            cursor.execute(REMOVE_ARCHIVED_SQL, {'ids': ids})
+    if product_info_ids:
+        bump_catalog_version()
+
+
+def refresh_shop_entries(shop):
+    """
+    Переносит в витрину название магазина и приём заказов,
+    переписывая только строки, где они отличаются.
+    """
+    if CatalogEntry.objects.filter(shop_id=shop.id).exclude(
+            shop_name=shop.name, accepting_orders=shop.accepting_orders
+    ).update(shop_name=shop.name, accepting_orders=shop.accepting_orders):
+        bump_catalog_version()
+
+
+def bump_shop_versions(product_info_ids):
+    """
+    Меняет версию каталога магазинов этих позиций, чтобы их выгрузка
+    не отдавалась по старому ETag после правок вне импорта.
+    """
+    Shop.objects.filter(product_infos__id__in=list(product_info_ids)).update(
+        catalog_version=F('catalog_version') + 1)
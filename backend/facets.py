@@ -0,0 +1,56 @@
+from django.db import connection
+from django.db.models import Count
+
+# Сколько самых частых значений каждого параметра попадает в ответ
+MAX_PARAMETER_VALUES = 50
+
+# Значения параметров отфильтрованных строк витрины с количеством
+# товаров, по MAX_PARAMETER_VALUES самых частых на параметр
+PARAMETER_FACETS_SQL = """
+    SELECT name, value, count FROM (
+        SELECT parameter.key AS name, parameter.value AS value,
+               count(*) AS count,
+               row_number() OVER (
+                   PARTITION BY parameter.key
+                   ORDER BY count(*) DESC, parameter.value) AS position
+        FROM ({entries}) AS entry
+        CROSS JOIN LATERAL jsonb_each_text(entry.parameters) AS parameter
+        GROUP BY parameter.key, parameter.value
+    ) AS counted
+    WHERE position <= %s
+    ORDER BY name, count DESC, value
+"""
+
+
+def catalog_facets(queryset):
+    """
+    Количество товаров по категориям, магазинам и значениям параметров
+    для отфильтрованных строк витрины каталога. Три запроса
+    с группировкой, без соединения таблиц.
+    """
+    queryset = queryset.order_by()
+    categories = [
+        {'id': row['category_id'], 'name': row['category_name'],
+         'count': row['count']}
+        for row in queryset.values('category_id', 'category_name').annotate(
+            count=Count('pk')).order_by('-count', 'category_name')]
+    shops = [
+        {'id': row['shop_id'], 'name': row['shop_name'],
+         'count': row['count']}
+        for row in queryset.values('shop_id', 'shop_name').annotate(
+            count=Count('pk')).order_by('-count', 'shop_name')]
+
+    entries, params = queryset.values('parameters').query.sql_with_params()
+    parameters = {}
+    with connection.cursor() as cursor:
+        cursor.execute(PARAMETER_FACETS_SQL.format(entries=entries),
+                       (*params, MAX_PARAMETER_VALUES))
+        for name, value, count in cursor.fetchall():
+            parameters.setdefault(name, []).append(
+                {'value': value, 'count': count})
+
+    return {'total': sum(category['count'] for category in categories),
+            'categories': categories,
+            'shops': shops,
+            'parameters': [{'name': name, 'values': values}
+                           for name, values in parameters.items()]}
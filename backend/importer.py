@@ -0,0 +1,784 @@
+from decimal import Decimal
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import partial
+from tempfile import SpooledTemporaryFile
+
+import requests
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from backend.models import Category, Product, ProductInfo, Parameter, \
+    ProductParameter, Shop, StagedOfferIds, StagedProductInfo, ImportJob, \
+    OrderItem
+from backend.parsers import PARSERS, detect_format
+from backend.cache import bump_catalog_version
+from backend.catalog import refresh_catalog_entries
+
+# Размер пачки для запросов с IN и для bulk_create
+BATCH_SIZE = 1000
+
+# Размер пачки товаров, которую обрабатывает один воркер
+# при параллельной загрузке
+CHUNK_SIZE = 5000
+
+# Ключ advisory-блокировки PostgreSQL для создания товаров и параметров
+RESOLVE_LOCK_ID = 7301
+
+# Учёт пачек параллельного импорта: воркер прибавляет записанную
+# пачку, загрузчик по окончании прайс-листа записывает их общее число.
+# Строка задачи блокируется на время UPDATE, поэтому равенство счётчиков
+# видит ровно один вызов - он и запускает финализатор
+COUNT_CHUNKS_SQL = """
+    UPDATE backend_importjob
+    SET chunks_done = chunks_done + %(done)s,
+        chunks_total = coalesce(%(total)s, chunks_total)
+    WHERE id = %(job)s
+    RETURNING chunks_done, chunks_total
+"""
+
+# Позиции магазина, которых нет среди внешних id прайс-листа
+# (StagedOfferIds этого импорта)
+STALE_OFFERS_SQL = """
+    SELECT info.id
+    FROM backend_productinfo AS info
+    WHERE info.shop_id = %s
+      AND NOT EXISTS (
+          SELECT 1
+          FROM backend_stagedofferids AS seen,
+               unnest(seen.external_ids) AS seen_id
+          WHERE seen.token = %s
+            AND seen_id = info.external_id)
+"""
+
+# Через сколько брошенный черновик импорта можно удалять
+STAGING_TTL = timedelta(days=1)
+
+# Таймауты (соединение, чтение) при скачивании прайс-листа
+FETCH_TIMEOUT = (5, 60)
+# Размер куска при чтении ответа
+READ_CHUNK_SIZE = 64 * 1024
+# Прайс-листы больше этого размера скачиваются на диск, а не в память
+SPOOL_MAX_SIZE = 10 * 1024 * 1024
+
+# Общая сессия с пулом соединений и повторами с нарастающей задержкой
+session = requests.Session()
+session.mount('http://', HTTPAdapter(max_retries=Retry(
+    total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=('GET',))))
+session.mount('https://', session.get_adapter('http://'))
+
+# Поля ProductInfo со значениями позиции прайс-листа
+OFFER_FIELDS = ('model', 'price', 'price_rrc', 'quantity')
+# Поля ProductInfo, которые берутся из прайс-листа
+PRODUCT_INFO_FIELDS = ('product_id', *OFFER_FIELDS, 'content_hash')
+
+
+def chunks(items, size=BATCH_SIZE):
+    """
+    Разбивает список на пачки фиксированного размера.
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def resolve_categories(shop, categories):
+    """
+    Создаёт недостающие категории одной пачкой и привязывает их к магазину.
+    """
+    categories = {category['id']: category['name']
+                  for category in categories}
+    if not categories:
+        return
+    Category.objects.bulk_create(
+        [Category(id=category_id, name=name)
+         for category_id, name in categories.items()],
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+    shop.categories.add(*categories)
+
+
+def resolve_products(goods):
+    """
+    Возвращает словарь {(название, id категории): id товара},
+    создавая недостающие товары через bulk_create.
+    """
+    keys = {(item['name'], item['category']) for item in goods}
+    products = {}
+    names = list({name for name, _ in keys})
+    for batch in chunks(names):
+        for product_id, name, category_id in Product.objects.filter(
+                name__in=batch).values_list('id', 'name', 'category_id'):
+            products.setdefault((name, category_id), product_id)
+
+    missing = [Product(name=name, category_id=category_id)
+               for name, category_id in keys if
+               (name, category_id) not in products]
+    for product in Product.objects.bulk_create(missing,
+                                               batch_size=BATCH_SIZE):
+        products[(product.name, product.category_id)] = product.id
+    return products
+
+
+def resolve_parameters(names):
+    """
+    Возвращает словарь {название параметра: id параметра},
+    создавая недостающие параметры через bulk_create.
+    """
+    names = list(names)
+    parameters = {}
+    for batch in chunks(names):
+        for parameter_id, name in Parameter.objects.filter(
+                name__in=batch).values_list('id', 'name'):
+            parameters.setdefault(name, parameter_id)
+
+    missing = [Parameter(name=name) for name in names
+               if name not in parameters]
+    for parameter in Parameter.objects.bulk_create(missing,
+                                                   batch_size=BATCH_SIZE):
+        parameters[parameter.name] = parameter.id
+    return parameters
+
+
+def lock_dictionaries():
+    """
+    Блокировка до конца транзакции, под которой создаются магазины,
+    товары и параметры. Без неё параллельные импорты могут создать
+    дубликаты.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)',
+                       [RESOLVE_LOCK_ID])
+
+
+def offer_values(item):
+    """
+    Значения полей OFFER_FIELDS позиции прайс-листа.
+    """
+    return (item['model'], Decimal(str(item['price'])),
+            Decimal(str(item['price_rrc'])), int(item['quantity']))
+
+
+def content_hash(item):
+    """
+    Хеш позиции прайс-листа: название, категория, значения полей
+    и параметры.
+    """
+    # Decimal('100.0') и Decimal('100') дают один хеш
+    content = [item['name'], item['category'],
+               *(str(value.normalize()) if isinstance(value, Decimal)
+                 else str(value) for value in offer_values(item)),
+               {name: str(value)
+                for name, value in item.get('parameters', {}).items()}]
+    return hashlib.md5(json.dumps(
+        content, sort_keys=True, ensure_ascii=False,
+        default=str).encode()).hexdigest()
+
+
+def product_info_row(item):
+    """
+    Приводит позицию прайс-листа к значениям полей ProductInfo.
+    """
+    return {'product_id': item['product_id'],
+            **dict(zip(OFFER_FIELDS, offer_values(item))),
+            'content_hash': item['content_hash']}
+
+
+class ImportProgress:
+    """
+    Учёт прогресса и длительности фаз импорта в ImportJob.
+    Время фаз копится в процессе и прибавляется к записи задачи при save(),
+    поэтому воркеры параллельного импорта могут сохранять его независимо.
+    """
+    PHASES = ('fetch', 'parse', 'resolve', 'write', 'publish')
+
+    def __init__(self, job_id=None):
+        self.job_id = job_id
+        self.timings = dict.fromkeys(self.PHASES, 0.0)
+        self.payload = None
+        self.goods_read = 0
+
+    def track(self, payload):
+        """
+        Запоминает размер прайс-листа, который будет читать парсер.
+        Дальше каждый save() отмечает, сколько байт и товаров прочитано.
+        """
+        self.payload = payload
+        size = payload.seek(0, os.SEEK_END)
+        payload.seek(0)
+        self.save(bytes_total=size)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+
+    def timed(self, name, iterable):
+        """
+        Оборачивает итератор, засчитывая время получения элементов в фазу.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    value = next(iterator)
+                except StopIteration:
+                    return
+            yield value
+
+    def save(self, **fields):
+        if self.job_id is None:
+            return
+        if self.payload is not None and not self.payload.closed:
+            fields.setdefault('bytes_read', self.payload.tell())
+            fields.setdefault('goods_read', self.goods_read)
+        for name, spent in self.timings.items():
+            if spent:
+                fields[f'{name}_time'] = F(f'{name}_time') + spent
+        self.timings = dict.fromkeys(self.PHASES, 0.0)
+        ImportJob.objects.filter(id=self.job_id).update(**fields)
+
+
+class CatalogImporter:
+    """
+    Пакетная загрузка каталога магазина.
+    Из каждой пачки товаров отбираются позиции, изменившиеся с прошлого
+    импорта (по хешу содержимого), а внешние id всей пачки запоминаются
+    в StagedOfferIds. Отобранным позициям проставляется product_id,
+    недостающие товары и параметры создаются (resolve), затем они пишутся
+    в черновик StagedProductInfo под токеном импорта (write), не затрагивая
+    опубликованный каталог. Поэтому запись в базу при повторном импорте
+    пропорциональна числу изменений, а не размеру прайс-листа.
+    finish() одной транзакцией переносит разницу между черновиком и
+    ProductInfo: новые позиции создаются, изменённые обновляются,
+    пропавшие удаляются или архивируются, а версия каталога магазина
+    увеличивается.
+    Читатели видят либо старый каталог, либо новый целиком.
+    """
+
+    def __init__(self, shop, source=None, token=None, progress=None):
+        self.shop = shop
+        self.source = source
+        self.token = token or uuid.uuid4().hex
+        self.progress = progress or ImportProgress()
+        self.parameters = {}
+        self.categories = set()
+        self.stats = {'inserted': 0, 'updated': 0, 'deleted': 0}
+
+    def add_categories(self, categories):
+        resolve_categories(self.shop, categories)
+        self.categories.update(category['id'] for category in categories)
+
+    def check_categories(self, goods):
+        """
+        Проверяет, что категории товаров есть в прайс-листе или в базе.
+        Известные категории запоминаются, чтобы не запрашивать их снова.
+        """
+        unknown = {item['category'] for item in goods} - self.categories
+        if not unknown:
+            return
+        self.categories.update(Category.objects.filter(
+            id__in=unknown).values_list('id', flat=True))
+        for item in goods:
+            if item['category'] not in self.categories:
+                raise ValueError(f'Неизвестная категория {item["category"]} '
+                                 f'у товара {item["id"]}')
+
+    def add_goods(self, goods):
+        with self.progress.phase('write'):
+            self.remember(goods)
+        changed = self.changed(goods)
+        if changed:
+            self.write(self.resolve(changed))
+        self.progress.save(
+            goods_processed=F('goods_processed') + len(goods))
+
+    def remember(self, goods):
+        """
+        Запоминает внешние id пачки, по ним finish() находит позиции,
+        пропавшие из прайс-листа.
+        """
+        StagedOfferIds.objects.create(
+            token=self.token, shop_id=self.shop.id,
+            external_ids=[int(item['id']) for item in goods])
+
+    def changed(self, goods):
+        """
+        Оставляет позиции, которых нет в опубликованном каталоге, архивные
+        и те, у которых изменился хеш или значения полей (например,
+        остаток после оформления заказа). Остальные не пишутся в черновик.
+        """
+        with self.progress.phase('resolve'):
+            for item in goods:
+                item['content_hash'] = content_hash(item)
+            current = {
+                external_id: values for external_id, *values in
+                ProductInfo.objects.filter(
+                    shop_id=self.shop.id, archived=False,
+                    external_id__in=[int(item['id']) for item in goods]
+                ).values_list('external_id', 'content_hash', *OFFER_FIELDS)}
+            return [item for item in goods
+                    if current.get(int(item['id'])) !=
+                    [item['content_hash'], *offer_values(item)]]
+
+    def resolve(self, goods):
+        with self.progress.phase('resolve'), transaction.atomic():
+            self.check_categories(goods)
+            lock_dictionaries()
+            products = resolve_products(goods)
+            for item in goods:
+                item['product_id'] = products[
+                    (item['name'], item['category'])]
+            # Словарь параметров общий для всех пачек,
+            # запрашиваем только новые
+            names = {name for item in goods
+                     for name in item.get('parameters', {})}
+            self.parameters.update(
+                resolve_parameters(names - self.parameters.keys()))
+        return goods
+
+    def write(self, goods):
+        with self.progress.phase('write'):
+            self.stage(goods)
+
+    def stage(self, goods):
+        return StagedProductInfo.objects.bulk_create(
+            [StagedProductInfo(
+                token=self.token,
+                shop_id=self.shop.id,
+                external_id=item['id'],
+                parameters={
+                    self.parameters[name]: str(value)
+                    for name, value in item.get('parameters', {}).items()},
+                **product_info_row(item))
+             for item in goods],
+            batch_size=BATCH_SIZE)
+
+    def staged_batches(self):
+        """
+        Читает черновик пачками по external_id (keyset), повторы одного
+        external_id схлопываются.
+        """
+        staged = StagedProductInfo.objects.filter(token=self.token)
+        last = -1
+        while True:
+            batch = list(staged.filter(external_id__gt=last).order_by(
+                'external_id')[:BATCH_SIZE])
+            if not batch:
+                return
+            last = batch[-1].external_id
+            yield {row.external_id: row for row in batch}
+
+    def publish(self, staged):
+        existing = {
+            row['external_id']: row for row in
+            ProductInfo.objects.filter(
+                shop_id=self.shop.id, external_id__in=list(staged)
+            ).values('id', 'external_id', 'archived', *PRODUCT_INFO_FIELDS)}
+
+        to_create = []
+        to_update = []
+        to_refresh = set()
+        for external_id, row in staged.items():
+            values = {field: getattr(row, field)
+                      for field in PRODUCT_INFO_FIELDS}
+            current = existing.get(external_id)
+            if current is None:
+                to_create.append(ProductInfo(
+                    shop_id=self.shop.id, external_id=external_id,
+                    **values))
+            elif current['archived'] or any(
+                    current[field] != values[field]
+                    for field in PRODUCT_INFO_FIELDS):
+                # Архивная позиция снова есть в прайс-листе
+                to_update.append(ProductInfo(id=current['id'], archived=False,
+                                             **values))
+                to_refresh.add(current['id'])
+
+        ProductInfo.objects.bulk_update(
+            to_update, (*PRODUCT_INFO_FIELDS, 'archived'),
+            batch_size=BATCH_SIZE)
+        ProductInfo.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+
+        product_info_ids = {external_id: row['id']
+                            for external_id, row in existing.items()}
+        product_info_ids.update(
+            {product_info.external_id: product_info.id
+             for product_info in to_create})
+        to_refresh.update(sync_parameters(staged, product_info_ids,
+                                          skip_existing=not existing))
+        to_refresh.update(product_info.id for product_info in to_create)
+        refresh_catalog_entries(to_refresh)
+
+        self.stats['inserted'] += len(to_create)
+        self.stats['updated'] += len(to_update)
+
+    def remove_stale(self):
+        """
+        Убирает из каталога позиции, которых не было в прайс-листе.
+        Позиции из оформленных заказов архивируются, чтобы не удалить
+        каскадом строки этих заказов, остальные удаляются.
+        """
+        stale = ProductInfo.objects.filter(
+            archived=False, id__in=RawSQL(STALE_OFFERS_SQL,
+                                          (self.shop.id, self.token)))
+        ordered = list(stale.filter(Exists(
+            OrderItem.objects.filter(product_id=OuterRef('pk')).exclude(
+                order__status='basket'))).values_list('id', flat=True))
+        for batch in chunks(ordered):
+            ProductInfo.objects.filter(id__in=batch).update(archived=True,
+                                                            quantity=0)
+        refresh_catalog_entries(ordered)
+        self.stats['deleted'] += len(ordered) + stale.delete()[1].get(
+            ProductInfo._meta.label, 0)
+        if self.stats['deleted']:
+            bump_catalog_version()
+
+    def flip_version(self):
+        """
+        Увеличивает версию каталога магазина и запоминает данные загрузки.
+        """
+        Shop.objects.filter(id=self.shop.id).update(
+            catalog_version=F('catalog_version') + 1, **(self.source or {}))
+
+    def finish(self):
+        """
+        Публикует черновик одной транзакцией, убирает позиции, которых не
+        было в прайс-листе, запоминает данные загрузки и возвращает
+        количество вставленных, обновлённых и удалённых строк.
+        """
+        with self.progress.phase('publish'), transaction.atomic():
+            for staged in self.staged_batches():
+                self.publish(staged)
+            self.remove_stale()
+            self.flip_version()
+        self.discard()
+        self.progress.save(state='done', finished_at=timezone.now(),
+                           **self.stats)
+        return self.stats
+
+    def discard(self):
+        """
+        Удаляет черновик этого импорта и брошенные черновики магазина.
+        """
+        for model in (StagedProductInfo, StagedOfferIds):
+            model.objects.filter(
+                Q(token=self.token) |
+                Q(shop_id=self.shop.id,
+                  created_at__lt=timezone.now() - STAGING_TTL)).delete()
+
+
+class ParallelCatalogImporter(CatalogImporter):
+    """
+    Параллельная загрузка каталога.
+    Категории, товары и параметры разрешаются один раз в этом процессе,
+    а каждая пачка по CHUNK_SIZE товаров сразу уходит воркеру Celery,
+    поэтому прайс-лист не копится в памяти. Воркер только пишет пачку
+    в черновик (stage_chunk). Когда записана последняя пачка, финализатор
+    публикует весь черновик одной транзакцией, как finish() обычного
+    импорта (finish_chunks). До этого опубликованный каталог не меняется,
+    а при ошибке в пачке черновик удаляется. Нужна задача импорта
+    (ImportJob), в ней ведётся учёт пачек.
+    """
+
+    def __init__(self, shop, source=None, token=None, progress=None):
+        super().__init__(shop, source, token, progress)
+        if self.progress.job_id is None:
+            raise ValueError('Параллельному импорту нужна задача импорта')
+        self.chunks = 0
+
+    def write(self, goods):
+        from backend.tasks import import_goods_chunk
+
+        names = {name for item in goods
+                 for name in item.get('parameters', {})}
+        import_goods_chunk.delay(
+            self.shop.id, self.token, goods,
+            {name: self.parameters[name] for name in names},
+            self.source, self.progress.job_id)
+        self.chunks += 1
+
+    def finish(self):
+        self.progress.save()
+        if self.count_chunks(total=self.chunks):
+            self.start_finish()
+        return {'chunks': self.chunks}
+
+    def count_chunks(self, done=0, total=None):
+        """
+        Учитывает записанную пачку (done) или общее число пачек
+        (total). Возвращает True, если после этого записаны все пачки.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(COUNT_CHUNKS_SQL, {
+                'job': self.progress.job_id, 'done': done, 'total': total})
+            chunks_done, chunks_total = cursor.fetchone()
+        return chunks_done == chunks_total
+
+    def start_finish(self):
+        from backend.tasks import finish_import
+
+        finish_import.delay(self.shop.id, self.token, self.source,
+                            self.progress.job_id)
+
+    def stage_chunk(self, goods):
+        """
+        Выполняется воркером: пишет пачку в черновик под токеном импорта.
+        Последняя записанная пачка запускает финализатор.
+        """
+        with self.progress.phase('write'):
+            self.stage(goods)
+        self.progress.save()
+        if self.count_chunks(done=1):
+            self.start_finish()
+
+    def finish_chunks(self):
+        """
+        Выполняется финализатором: публикует черновик всех пачек.
+        """
+        return CatalogImporter.finish(self)
+
+    def fail(self, error):
+        """
+        Ошибка в пачке или финализаторе: черновик удаляется, задача
+        импорта отмечается неудачной, остальные пачки пропускаются.
+        """
+        self.discard()
+        self.progress.save(state='failed', error=str(error),
+                           finished_at=timezone.now())
+
+
+def get_shop(name, user_id):
+    """
+    Магазин, в который загружается прайс-лист. Без пользователя
+    (загрузка из локальных файлов) магазин ищется по названию.
+    Поиск и создание идут под блокировкой справочников, поэтому
+    параллельные импорты одного магазина не создадут дубликаты.
+    """
+    with transaction.atomic():
+        lock_dictionaries()
+        if user_id is None:
+            shop = Shop.objects.filter(name=name).order_by('id').first()
+            return shop or Shop.objects.create(name=name)
+        shop, _ = Shop.objects.get_or_create(name=name, user_id=user_id)
+        return shop
+
+
+def find_shop(parser, payload):
+    """
+    Название магазина из прайс-листа, в котором товары идут раньше
+    магазина (yaml.dump сортирует ключи). Прайс-лист разбирается заново
+    с начала, после чего позиция чтения payload восстанавливается.
+    """
+    position = payload.tell()
+    payload.seek(0)
+    try:
+        for key, value in parser(payload):
+            if key == 'shop':
+                return value
+    finally:
+        payload.seek(position)
+    return None
+
+
+def import_events(events, user_id, importer_class=CatalogImporter,
+                  batch_size=BATCH_SIZE, source=None, progress=None,
+                  shop_name=None):
+    """
+    Загружает прайс-лист из потока пар (ключ, значение), которые отдаёт
+    потоковый парсер. Товары копятся в пачки по batch_size и передаются
+    загрузчику по мере чтения, поэтому размер файла не влияет на расход
+    памяти. source - данные загрузки, которые сохраняются в магазине
+    после успешного импорта, progress - учёт хода задачи импорта.
+    shop_name - функция, которая находит название магазина, если товары
+    идут раньше него.
+    """
+    progress = progress or ImportProgress()
+    importer = None
+    categories = []
+    batch = []
+    total = 0
+
+    def start(name):
+        shop = get_shop(name, user_id)
+        started = importer_class(shop, source, progress=progress)
+        progress.save(shop=shop)
+        started.add_categories(categories)
+        return started
+
+    try:
+        for key, value in events:
+            if key == 'shop':
+                if importer is None:
+                    importer = start(value)
+                elif importer.shop.name != value:
+                    raise ValueError('Прайс-лист относится к другому магазину')
+            elif key == 'categories':
+                categories.extend(value)
+                if importer is not None:
+                    importer.add_categories(value)
+            elif key == 'goods':
+                if importer is None:
+                    name = None
+                    if shop_name is not None:
+                        with progress.phase('parse'):
+                            name = shop_name()
+                    if name is None:
+                        raise ValueError('В прайс-листе не указан '
+                                         'магазин (shop)')
+                    importer = start(name)
+                total += 1
+                batch.append(value)
+                if len(batch) >= batch_size:
+                    progress.goods_read = total
+                    importer.add_goods(batch)
+                    batch = []
+        if importer is None:
+            raise ValueError('В прайс-листе не указан магазин (shop)')
+        progress.goods_read = total
+        if batch:
+            importer.add_goods(batch)
+        progress.save(goods_total=total)
+        return {'shop': importer.shop.name, 'goods': total,
+                **importer.finish()}
+    except Exception:
+        # Черновик прерванного импорта не нужен
+        if importer is not None:
+            importer.discard()
+        raise
+
+
+def import_file(path, user_id=None, catalog_format=None, progress=None,
+                **kwargs):
+    """
+    Загружает прайс-лист из локального файла. Формат берётся из
+    catalog_format или определяется по расширению файла.
+    """
+    progress = progress or ImportProgress()
+    parser = PARSERS[catalog_format or detect_format(path)]
+    with open(path, 'rb') as payload:
+        progress.track(payload)
+        return import_events(progress.timed('parse', parser(payload)),
+                             user_id, progress=progress,
+                             shop_name=partial(find_shop, parser, payload),
+                             **kwargs)
+
+
+def fetch_headers(shop, url):
+    """
+    Заголовки условного запроса по данным последнего импорта магазина.
+    """
+    headers = {}
+    if shop is not None and shop.url == url:
+        if shop.import_etag:
+            headers['If-None-Match'] = shop.import_etag
+        if shop.import_last_modified:
+            headers['If-Modified-Since'] = shop.import_last_modified
+    return headers
+
+
+def import_url(url, user_id, progress=None, catalog_format=None, **kwargs):
+    """
+    Скачивает прайс-лист по ссылке и загружает его через import_events.
+    Формат (yaml, json, ndjson, csv) берётся из catalog_format или
+    определяется по Content-Type и расширению файла.
+    Запрос условный (ETag / Last-Modified), ответ 304 ничего не меняет.
+    Тело читается кусками во временный файл с подсчётом sha256: если хеш
+    совпал с последним успешным импортом, работа с базой пропускается.
+    """
+    progress = progress or ImportProgress()
+    shop = Shop.objects.filter(user_id=user_id).first()
+    with SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as payload:
+        with progress.phase('fetch'), session.get(
+                url, headers=fetch_headers(shop, url), stream=True,
+                timeout=FETCH_TIMEOUT) as response:
+            if response.status_code == 304:
+                source = None
+            else:
+                response.raise_for_status()
+                source = {'url': url,
+                          'import_etag': response.headers.get('ETag', ''),
+                          'import_last_modified': response.headers.get(
+                              'Last-Modified', '')}
+                digest = hashlib.sha256()
+                for chunk in response.iter_content(
+                        chunk_size=READ_CHUNK_SIZE):
+                    digest.update(chunk)
+                    payload.write(chunk)
+                source['import_hash'] = digest.hexdigest()
+                catalog_format = catalog_format or detect_format(
+                    url, response.headers.get('Content-Type'))
+
+        if source is None:
+            reason = 'not_modified'
+        elif shop is not None and shop.import_hash == source['import_hash']:
+            Shop.objects.filter(id=shop.id).update(**source)
+            reason = 'unchanged'
+        else:
+            progress.track(payload)
+            parser = PARSERS[catalog_format]
+            return import_events(
+                progress.timed('parse', parser(payload)),
+                user_id, source=source, progress=progress,
+                shop_name=partial(find_shop, parser, payload), **kwargs)
+
+    progress.save(state='skipped', shop=shop, finished_at=timezone.now())
+    return {'skipped': True, 'reason': reason}
+
+
+def sync_parameters(staged, product_info_ids, skip_existing=False):
+    """
+    Приводит значения параметров опубликованных позиций к черновику,
+    затрагивая только изменившиеся значения.
+    Возвращает id позиций, у которых изменились параметры.
+    """
+    wanted = {
+        (product_info_ids[external_id], int(parameter_id)): value
+        for external_id, row in staged.items()
+        for parameter_id, value in row.parameters.items()}
+
+    existing = {}
+    if not skip_existing:
+        existing = {
+            (product_info_id, parameter_id): (pk, value)
+            for pk, product_info_id, parameter_id, value in
+            ProductParameter.objects.filter(
+                product_info_id__in=list(product_info_ids.values())
+            ).values_list('id', 'product_info_id', 'parameter_id', 'value')}
+
+    to_create = []
+    to_update = []
+    changed = set()
+    for key, value in wanted.items():
+        if key not in existing:
+            to_create.append(ProductParameter(
+                product_info_id=key[0], parameter_id=key[1], value=value))
+            changed.add(key[0])
+        elif existing[key][1] != value:
+            to_update.append(ProductParameter(id=existing[key][0],
+                                              value=value))
+            changed.add(key[0])
+    to_delete = []
+    for key, (pk, _) in existing.items():
+        if key not in wanted:
+            to_delete.append(pk)
+            changed.add(key[0])
+
+    for batch in chunks(to_delete):
+        ProductParameter.objects.filter(id__in=batch).delete()
+    ProductParameter.objects.bulk_update(to_update, ['value'],
+                                         batch_size=BATCH_SIZE)
+    ProductParameter.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+    return changed
@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from backend.benchmark import run_checkout_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Замеряет одновременное оформление заказов на один товар '
+            'со списанием остатков. Пишет в базу: запускайте на базе '
+            'для разработки')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--buyers', type=int, default=1000,
+            help='Количество покупателей с этим товаром в корзине')
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Количество процессов, оформляющих заказы одновременно')
+        parser.add_argument(
+            '--stock', type=int, default=None,
+            help='Остаток товара (по умолчанию - половина спроса)')
+        parser.add_argument(
+            '--quantity', type=int, default=1,
+            help='Сколько штук товара в каждой корзине')
+        parser.add_argument(
+            '--output', default='bench-checkout.json',
+            help='Файл JSON с результатами')
+
+    def handle(self, *args, **options):
+        result = run_checkout_benchmark(
+            options['buyers'], options['workers'], options['stock'],
+            options['quantity'])
+        self.stdout.write(
+            f'{result["buyers"]} заказов в {result["workers"]} процессах: '
+            f'{result["wall_time"]:.2f} с, '
+            f'{result["checkouts_per_second"]:.0f} заказов/с, '
+            f'оформлено {result["confirmed"]}, отказов {result["rejected"]}, '
+            f'p95 {result["latency_ms"]["p95"]:.1f} мс, '
+            f'остаток {result["stock_left"]} из {result["stock"]}')
+        if result['oversold']:
+            self.stderr.write(self.style.ERROR(
+                'Товар продан сверх остатка'))
+
+        with open(options['output'], 'w', encoding='utf-8') as out:
+            json.dump(result, out, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты сохранены в {options["output"]}'))
@@ -0,0 +1,62 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.benchmark import run_benchmark
+from backend.parsers import PARSERS
+
+
+class Command(BaseCommand):
+    help = ('Замеряет загрузку синтетических прайс-листов через do_import. '
+            'Пишет в базу: запускайте на базе для разработки')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='1000,10000,100000',
+            help='Размеры каталогов через запятую, например 1000,1000000')
+        parser.add_argument(
+            '--parameters', type=int, default=4,
+            help='Количество параметров у каждого товара')
+        parser.add_argument(
+            '--format', choices=list(PARSERS), default='yaml',
+            dest='catalog_format', help='Формат прайс-листов')
+        parser.add_argument(
+            '--changed', type=float, default=0.01,
+            help='Доля товаров с новой ценой при повторной загрузке')
+        parser.add_argument(
+            '--workers', default='',
+            help='Количества процессов воркера Celery через запятую, '
+                 'например 1,2,4: замерить параллельный импорт')
+        parser.add_argument(
+            '--output', default='bench-import.json',
+            help='Файл JSON с результатами')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+            workers = [int(count) for count in
+                       options['workers'].split(',') if count]
+        except ValueError:
+            raise CommandError('Размеры каталогов и количества воркеров '
+                               'должны быть числами')
+
+        def report(case):
+            mode = f', воркеров {case["workers"]}' if case['workers'] else ''
+            self.stdout.write(
+                f'{case["goods"]} товаров, {case["scenario"]}{mode}: '
+                f'{case["wall_time"]:.2f} с, запросов {case["queries"]}, '
+                f'память {case["peak_rss_mb"]:.0f} МБ, '
+                f'{case["goods_per_second"]:.0f} товаров/с, '
+                f'{case["rows_per_second"]:.0f} строк/с')
+
+        with tempfile.TemporaryDirectory() as directory:
+            results = run_benchmark(
+                directory, sizes, options['parameters'],
+                options['catalog_format'], options['changed'], report,
+                workers)
+
+        with open(options['output'], 'w', encoding='utf-8') as out:
+            json.dump(results, out, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты сохранены в {options["output"]}'))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from backend.benchmark import write_catalog
+from backend.parsers import PARSERS
+
+
+class Command(BaseCommand):
+    help = 'Создаёт синтетический прайс-лист заданного размера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Путь к создаваемому файлу')
+        parser.add_argument(
+            '--goods', type=int, default=10000,
+            help='Количество товаров (1000, 10000, 100000, 1000000...)')
+        parser.add_argument(
+            '--parameters', type=int, default=4,
+            help='Количество параметров у каждого товара')
+        parser.add_argument(
+            '--format', choices=list(PARSERS), default='yaml',
+            dest='catalog_format', help='Формат прайс-листа')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора: при одном зерне товары совпадают')
+        parser.add_argument(
+            '--changed', type=float, default=0.0,
+            help='Доля товаров с изменённой ценой, от 0 до 1')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        write_catalog(options['output'], options['goods'],
+                      options['parameters'], options['catalog_format'],
+                      options['seed'], options['changed'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{options["output"]}: {options["goods"]} товаров за '
+            f'{time.perf_counter() - start:.2f} с'))
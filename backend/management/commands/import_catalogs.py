@@ -0,0 +1,107 @@
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from backend.parsers import PARSERS, EXTENSIONS
+
+
+def collect_files(paths):
+    """
+    Раскрывает каталоги и шаблоны glob в список файлов прайс-листов.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if os.path.splitext(name)[1].lower() in EXTENSIONS)
+        else:
+            matches = sorted(glob.glob(path)) or [path]
+        files.extend(match for match in matches if os.path.isfile(match))
+    return list(dict.fromkeys(files))
+
+
+def init_worker():
+    django.setup()
+
+
+def import_worker(path, catalog_format):
+    """
+    Разбирает и загружает один файл в отдельном процессе.
+    """
+    from backend.importer import import_file, ImportProgress
+
+    progress = ImportProgress()
+    start = time.perf_counter()
+    try:
+        result = import_file(path, catalog_format=catalog_format,
+                             progress=progress)
+    except Exception as e:
+        return {'path': path, 'error': str(e)}
+    finally:
+        connections.close_all()
+    return {'path': path,
+            'seconds': time.perf_counter() - start,
+            'parse': progress.timings['parse'],
+            **result}
+
+
+class Command(BaseCommand):
+    help = 'Загружает прайс-листы магазинов из локальных файлов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='+',
+            help='Файлы, каталоги или шаблоны glob с прайс-листами')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Количество параллельно загружаемых файлов')
+        parser.add_argument(
+            '--format', choices=list(PARSERS), dest='catalog_format',
+            help='Формат файлов, если его нельзя определить по расширению')
+
+    def handle(self, *args, **options):
+        files = collect_files(options['paths'])
+        if not files:
+            raise CommandError('Не найдено ни одного файла прайс-листа')
+
+        # Дочерние процессы открывают собственные соединения с базой
+        connections.close_all()
+        total_goods = 0
+        failed = 0
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=options['workers'],
+                                 initializer=init_worker) as pool:
+            futures = [pool.submit(import_worker, path,
+                                   options['catalog_format'])
+                       for path in files]
+            for future in as_completed(futures):
+                result = future.result()
+                if 'error' in result:
+                    failed += 1
+                    self.stderr.write(
+                        f'{result["path"]}: ошибка: {result["error"]}')
+                    continue
+                total_goods += result['goods']
+                rate = result['goods'] / result['seconds'] \
+                    if result['seconds'] else 0
+                self.stdout.write(
+                    f'{result["shop"]} ({result["path"]}): '
+                    f'{result["goods"]} товаров за '
+                    f'{result["seconds"]:.2f} с (разбор '
+                    f'{result["parse"]:.2f} с, {rate:.0f} товаров/с), '
+                    f'добавлено {result["inserted"]}, '
+                    f'обновлено {result["updated"]}, '
+                    f'удалено {result["deleted"]}')
+
+        elapsed = time.perf_counter() - start
+        rate = total_goods / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено файлов: {len(files) - failed} из {len(files)}, '
+            f'товаров: {total_goods} за {elapsed:.2f} с '
+            f'({rate:.0f} товаров/с)'))
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:27
+
+from django.db import migrations
+
+# Повторяющиеся позиции магазина с одним external_id сливаются в первую:
+# строки заказов переносятся на неё, параметры повторов удаляются.
+# Внешние ключи проверяются сразу, иначе отложенные проверки не дадут
+# изменить таблицу в той же транзакции
+MERGE_DUPLICATES_SQL = """
+    SET CONSTRAINTS ALL IMMEDIATE;
+
+    UPDATE backend_orderitem AS item
+    SET product_id = duplicate.first_id
+    FROM (
+        SELECT id, min(id) OVER (
+            PARTITION BY shop_id, external_id) AS first_id
+        FROM backend_productinfo
+        WHERE external_id IS NOT NULL
+    ) AS duplicate
+    WHERE item.product_id = duplicate.id
+      AND duplicate.id <> duplicate.first_id;
+
+    DELETE FROM backend_productparameter AS value
+    USING backend_productinfo AS info, backend_productinfo AS first
+    WHERE value.product_info_id = info.id
+      AND first.shop_id = info.shop_id
+      AND first.external_id = info.external_id
+      AND first.id < info.id;
+
+    DELETE FROM backend_productinfo AS info
+    USING backend_productinfo AS first
+    WHERE first.shop_id = info.shop_id
+      AND first.external_id = info.external_id
+      AND first.id < info.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_shop_accepting_orders'),
+    ]
+
+    operations = [
+        migrations.RunSQL(MERGE_DUPLICATES_SQL, migrations.RunSQL.noop),
+        migrations.AlterUniqueTogether(
+            name='productinfo',
+            unique_together={('shop', 'external_id')},
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_alter_productinfo_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='import_etag',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='import_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='import_last_modified',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
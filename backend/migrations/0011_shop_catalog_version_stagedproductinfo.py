@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_shop_import_etag_shop_import_hash_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='catalog_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StagedProductInfo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=32)),
+                ('external_id', models.PositiveIntegerField()),
+                ('model', models.CharField(blank=True, max_length=100, null=True)),
+                ('quantity', models.PositiveIntegerField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('price_rrc', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('parameters', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.product')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staged_product_infos', to='backend.shop')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'external_id'], name='backend_sta_token_e40d56_idx')],
+            },
+        ),
+    ]
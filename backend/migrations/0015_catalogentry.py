@@ -0,0 +1,121 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:01
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Заполнение витрины текущим каталогом, до создания индексов
+FILL_CATALOG_SQL = """
+    INSERT INTO backend_catalogentry (
+        product_info_id, product_id, product_name, category_id,
+        category_name, shop_id, shop_name, accepting_orders, model,
+        quantity, price, price_rrc, parameters, search_document,
+        search_vector)
+    SELECT info.id, info.product_id, product.name, product.category_id,
+           category.name, info.shop_id, shop.name, shop.accepting_orders,
+           info.model, info.quantity, info.price, info.price_rrc,
+           doc.parameters,
+           concat_ws(' ', product.name, doc.details, doc.parameter_values),
+           setweight(to_tsvector('russian', product.name), 'A') ||
+           setweight(to_tsvector('russian', doc.details), 'B') ||
+           setweight(to_tsvector('russian', doc.parameter_values), 'C')
+    FROM backend_productinfo AS info
+    JOIN backend_product AS product ON product.id = info.product_id
+    JOIN backend_category AS category ON category.id = product.category_id
+    JOIN backend_shop AS shop ON shop.id = info.shop_id
+    CROSS JOIN LATERAL (
+        SELECT concat_ws(' ', info.model, category.name) AS details,
+               coalesce(jsonb_object_agg(parameter.name, value.value),
+                        '{}') AS parameters,
+               coalesce(string_agg(value.value, ' ' ORDER BY value.id),
+                        '') AS parameter_values
+        FROM backend_productparameter AS value
+        JOIN backend_parameter AS parameter
+            ON parameter.id = value.parameter_id
+        WHERE value.product_info_id = info.id
+    ) AS doc
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0014_productinfo_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogEntry',
+            fields=[
+                ('product_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_entry', serialize=False, to='backend.productinfo')),
+                ('product_id', models.IntegerField()),
+                ('product_name', models.CharField(max_length=200)),
+                ('category_id', models.IntegerField()),
+                ('category_name', models.CharField(max_length=200)),
+                ('shop_id', models.IntegerField()),
+                ('shop_name', models.CharField(max_length=200)),
+                ('accepting_orders', models.BooleanField()),
+                ('model', models.CharField(blank=True, max_length=100, null=True)),
+                ('quantity', models.PositiveIntegerField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('price_rrc', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('parameters', models.JSONField(default=dict)),
+                ('search_document', models.TextField(blank=True, default='')),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+            ],
+        ),
+        migrations.RunSQL(FILL_CATALOG_SQL, migrations.RunSQL.noop),
+        migrations.RemoveIndex(
+            model_name='productinfo',
+            name='productinfo_shop_price_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='productinfo',
+            name='productinfo_price_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='productinfo',
+            name='productinfo_in_stock_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='productinfo',
+            name='productinfo_search_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='productinfo',
+            name='productinfo_search_trgm_idx',
+        ),
+        migrations.RemoveField(
+            model_name='productinfo',
+            name='search_document',
+        ),
+        migrations.RemoveField(
+            model_name='productinfo',
+            name='search_vector',
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(fields=['category_id', 'product_info'], name='catalog_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(fields=['shop_id', 'price'], name='catalog_shop_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(fields=['price', 'product_info'], name='catalog_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['product_info'], name='catalog_in_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='catalog_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_document'], name='catalog_search_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
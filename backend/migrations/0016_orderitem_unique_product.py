@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:14
+
+from django.db import migrations
+
+# Повторяющиеся строки одного товара в заказе сливаются в первую
+MERGE_DUPLICATES_SQL = """
+    UPDATE backend_orderitem AS item
+    SET quantity = duplicate.quantity
+    FROM (
+        SELECT min(id) AS id, sum(quantity) AS quantity
+        FROM backend_orderitem
+        GROUP BY order_id, product_id
+        HAVING count(*) > 1
+    ) AS duplicate
+    WHERE item.id = duplicate.id;
+
+    DELETE FROM backend_orderitem AS item
+    USING backend_orderitem AS first
+    WHERE first.order_id = item.order_id
+      AND first.product_id = item.product_id
+      AND first.id < item.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0015_catalogentry'),
+    ]
+
+    operations = [
+        migrations.RunSQL(MERGE_DUPLICATES_SQL, migrations.RunSQL.noop),
+        migrations.AlterUniqueTogether(
+            name='orderitem',
+            unique_together={('order', 'product')},
+        ),
+    ]
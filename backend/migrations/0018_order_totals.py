@@ -0,0 +1,61 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Оформленным раньше заказам достаются текущие цены каталога:
+# других сведений о ценах на момент оформления нет
+FILL_TOTALS_SQL = """
+    UPDATE backend_orderitem AS line
+    SET price = info.price
+    FROM backend_productinfo AS info, backend_order AS orders
+    WHERE info.id = line.product_id
+      AND orders.id = line.order_id
+      AND orders.status <> 'basket';
+
+    INSERT INTO backend_ordershoptotal (order_id, shop_id, total_sum)
+    SELECT line.order_id, line.shop_id, sum(line.quantity * line.price)
+    FROM backend_orderitem AS line
+    JOIN backend_order AS orders ON orders.id = line.order_id
+    WHERE orders.status <> 'basket'
+    GROUP BY line.order_id, line.shop_id;
+
+    UPDATE backend_order AS orders
+    SET total_sum = coalesce((
+        SELECT sum(total.total_sum) FROM backend_ordershoptotal AS total
+        WHERE total.order_id = orders.id), 0)
+    WHERE orders.status <> 'basket';
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0017_order_stock_reserved'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_sum',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.CreateModel(
+            name='OrderShopTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_sum', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_totals', to='backend.order')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_totals', to='backend.shop')),
+            ],
+            options={
+                'unique_together': {('order', 'shop')},
+            },
+        ),
+        migrations.RunSQL(FILL_TOTALS_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0018_order_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'dt'], name='order_status_dt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordershoptotal',
+            index=models.Index(fields=['shop', 'order'], name='ordershoptotal_shop_order_idx'),
+        ),
+    ]
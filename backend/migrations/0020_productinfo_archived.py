@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0019_partner_order_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='archived',
+            field=models.BooleanField(default=False),
+        ),
+    ]
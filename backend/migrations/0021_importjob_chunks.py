@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0020_productinfo_archived'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='chunks_done',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='chunks_total',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0021_importjob_chunks'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shop',
+            name='url',
+            field=models.URLField(max_length=500, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0022_alter_shop_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='bytes_read',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='bytes_total',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='goods_read',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
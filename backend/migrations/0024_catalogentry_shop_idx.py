@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0023_importjob_bytes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='catalogentry',
+            name='catalog_shop_price_idx',
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(fields=['shop_id', 'product_info'], name='catalog_shop_idx'),
+        ),
+    ]
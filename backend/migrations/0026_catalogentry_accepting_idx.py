@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0025_offer_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(condition=models.Q(('accepting_orders', True)), fields=['product_info'], name='catalog_accepting_idx'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser, \
     PermissionsMixin
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django_rest_passwordreset.tokens import get_token_generator
 
 
@@ -62,11 +65,19 @@ class User(AbstractBaseUser, PermissionsMixin):
 # Модель магазина
 class Shop(models.Model):
     name = models.CharField(max_length=200)
-    url = models.URLField(null=True)
+    # Ссылка последнего импорта, той же длины, что и ImportJob.url
+    url = models.URLField(max_length=500, null=True)
     user = models.OneToOneField(User,
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
     accepting_orders = models.BooleanField(default=True)
+    # Данные последнего успешного импорта для условной загрузки прайса
+    import_etag = models.CharField(max_length=200, blank=True, default='')
+    import_last_modified = models.CharField(max_length=100, blank=True,
+                                            default='')
+    import_hash = models.CharField(max_length=64, blank=True, default='')
+    # Номер опубликованной версии каталога, растёт с каждым импортом
+    catalog_version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
@@ -102,11 +113,103 @@ class ProductInfo(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     price_rrc = models.DecimalField(max_digits=10, decimal_places=2)
     external_id = models.PositiveIntegerField()
+    # Позиция пропала из прайс-листа, но на неё ссылаются оформленные
+    # заказы: она скрыта из каталога, а не удалена
+    archived = models.BooleanField(default=False)
+    # Хеш позиции прайс-листа при последнем импорте: неизменившиеся
+    # позиции не пишутся в черновик
+    content_hash = models.CharField(max_length=32, blank=True, default='')
+
+    class Meta:
+        unique_together = ('shop', 'external_id')
 
     def __str__(self):
         return f"{self.product.name} в {self.shop.name} — {self.price} руб."
 
 
+# Витрина каталога для чтения: одна строка на предложение магазина со
+# всем, что отдают список товаров и поиск. Строки пересобирает импорт
+# (backend.catalog), поэтому при чтении таблицы товаров, категорий и
+# магазинов не соединяются
+class CatalogEntry(models.Model):
+    product_info = models.OneToOneField(ProductInfo, primary_key=True,
+                                        related_name='catalog_entry',
+                                        on_delete=models.CASCADE)
+    product_id = models.IntegerField()
+    product_name = models.CharField(max_length=200)
+    category_id = models.IntegerField()
+    category_name = models.CharField(max_length=200)
+    shop_id = models.IntegerField()
+    shop_name = models.CharField(max_length=200)
+    accepting_orders = models.BooleanField()
+    model = models.CharField(max_length=100, blank=True, null=True)
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    price_rrc = models.DecimalField(max_digits=10, decimal_places=2)
+    # Значения параметров: {название параметра: значение}
+    parameters = models.JSONField(default=dict)
+    # Поисковый документ: название, модель, категория и значения параметров
+    search_document = models.TextField(blank=True, default='')
+    search_vector = SearchVectorField(null=True)
+
+    class Meta:
+        # Индексы под фильтры списка товаров, который сортируется по id
+        indexes = [
+            models.Index(fields=['category_id', 'product_info'],
+                         name='catalog_category_idx'),
+            models.Index(fields=['shop_id', 'product_info'],
+                         name='catalog_shop_idx'),
+            models.Index(fields=['price', 'product_info'],
+                         name='catalog_price_idx'),
+            models.Index(fields=['product_info'],
+                         condition=models.Q(quantity__gt=0),
+                         name='catalog_in_stock_idx'),
+            models.Index(fields=['product_info'],
+                         condition=models.Q(accepting_orders=True),
+                         name='catalog_accepting_idx'),
+            GinIndex(fields=['search_vector'], name='catalog_search_idx'),
+            GinIndex(fields=['search_document'], opclasses=['gin_trgm_ops'],
+                     name='catalog_search_trgm_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_name} в {self.shop_name} — {self.price} руб."
+
+
+# Позиция каталога, загруженная импортом, но ещё не опубликованная.
+# Импорт пишет сюда пачки, а затем одной транзакцией переносит разницу
+# в ProductInfo и ProductParameter
+class StagedProductInfo(models.Model):
+    token = models.CharField(max_length=32)
+    shop = models.ForeignKey(Shop, related_name='staged_product_infos',
+                             on_delete=models.CASCADE)
+    external_id = models.PositiveIntegerField()
+    product = models.ForeignKey(Product, related_name='+',
+                                on_delete=models.CASCADE)
+    model = models.CharField(max_length=100, blank=True, null=True)
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    price_rrc = models.DecimalField(max_digits=10, decimal_places=2)
+    # Значения параметров: {id параметра: значение}
+    parameters = models.JSONField(default=dict)
+    content_hash = models.CharField(max_length=32, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['token', 'external_id'])]
+
+
+# Внешние id всех позиций загружаемого прайс-листа, одна строка на пачку.
+# По ним в конце импорта находятся пропавшие позиции, поэтому
+# неизменившиеся позиции в черновик StagedProductInfo не пишутся
+class StagedOfferIds(models.Model):
+    token = models.CharField(max_length=32, db_index=True)
+    shop = models.ForeignKey(Shop, related_name='+',
+                             on_delete=models.CASCADE)
+    external_ids = ArrayField(models.PositiveIntegerField())
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
 # Параметры (характеристики) товара
 class Parameter(models.Model):
     name = models.CharField(max_length=100)
@@ -145,12 +248,23 @@ class Order(models.Model):
     )
     status = models.CharField(max_length=20, choices=STATUS_CHOICES,
                               default='new')
+    # Остатки по заказу списаны со склада и вернутся при отмене
+    stock_reserved = models.BooleanField(default=False)
+    # Сумма заказа по ценам на момент оформления. У корзины не заполнена
+    total_sum = models.DecimalField(max_digits=12, decimal_places=2,
+                                    null=True, blank=True)
+
+    class Meta:
+        # Фильтр заказов по статусу и периоду
+        indexes = [models.Index(fields=['status', 'dt'],
+                                name='order_status_dt_idx')]
 
     def __str__(self):
         return f'Order #{self.id} - {self.user}'
 
 
-# Позиции заказа (конкретные товары в заказе)
+# Позиции заказа (конкретные товары в заказе).
+# Один товар встречается в заказе одной строкой
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items',
                               on_delete=models.CASCADE)
@@ -159,11 +273,80 @@ class OrderItem(models.Model):
     shop = models.ForeignKey(Shop, related_name='order_items',
                              on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
+    # Цена за штуку на момент оформления заказа
+    price = models.DecimalField(max_digits=10, decimal_places=2,
+                                null=True, blank=True)
+
+    class Meta:
+        unique_together = ('order', 'product')
 
     def __str__(self):
         return f'{self.product.product.name} x {self.quantity}'
 
 
+# Сумма заказа по одному магазину на момент оформления
+class OrderShopTotal(models.Model):
+    order = models.ForeignKey(Order, related_name='shop_totals',
+                              on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, related_name='order_totals',
+                             on_delete=models.CASCADE)
+    total_sum = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        unique_together = ('order', 'shop')
+        # Заказы магазина, новые первыми: ORDER BY order_id DESC
+        indexes = [models.Index(fields=['shop', 'order'],
+                                name='ordershoptotal_shop_order_idx')]
+
+    def __str__(self):
+        return f'Order #{self.order_id} - {self.shop_id}: {self.total_sum}'
+
+
+# Задача импорта прайс-листа: состояние, прогресс и время по фазам
+class ImportJob(models.Model):
+    STATE_CHOICES = (
+        ('queued', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Завершён'),
+        ('skipped', 'Пропущен'),
+        ('failed', 'Ошибка'),
+    )
+    user = models.ForeignKey(User, related_name='import_jobs',
+                             on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, related_name='import_jobs',
+                             blank=True, null=True,
+                             on_delete=models.SET_NULL)
+    url = models.URLField(max_length=500)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES,
+                             default='queued')
+    goods_total = models.PositiveIntegerField(blank=True, null=True)
+    goods_processed = models.PositiveIntegerField(default=0)
+    # Размер прайс-листа и сколько байт и товаров уже прочитано: пока
+    # goods_total неизвестен, по ним оценивается прогресс
+    bytes_total = models.PositiveBigIntegerField(blank=True, null=True)
+    bytes_read = models.PositiveBigIntegerField(default=0)
+    goods_read = models.PositiveIntegerField(default=0)
+    inserted = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+    # Параллельный импорт: сколько пачек отправлено воркерам (известно,
+    # когда прайс-лист прочитан целиком) и сколько уже записано в черновик
+    chunks_total = models.PositiveIntegerField(blank=True, null=True)
+    chunks_done = models.PositiveIntegerField(default=0)
+    # Длительность фаз в секундах
+    fetch_time = models.FloatField(default=0)
+    parse_time = models.FloatField(default=0)
+    resolve_time = models.FloatField(default=0)
+    write_time = models.FloatField(default=0)
+    publish_time = models.FloatField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f'Импорт #{self.id} ({self.state})'
+
+
 # Контактная информация пользователя
 class Contact(models.Model):
     CONTACT_TYPES = (
@@ -0,0 +1,20 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+# Постраничный вывод по курсору: WHERE pk > ... ORDER BY pk LIMIT n
+# вместо OFFSET, поэтому глубокие страницы отдаются так же быстро,
+# как первая
+class ProductCursorPagination(CursorPagination):
+    ordering = 'pk'
+    page_size = settings.PRODUCTS_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+# Заказы магазина: новые первыми, курсор по id заказа
+class OrderCursorPagination(CursorPagination):
+    ordering = '-id'
+    page_size = settings.ORDERS_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 500
@@ -0,0 +1,280 @@
+import codecs
+import csv
+import json
+import os
+from urllib.parse import urlparse
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# Размер куска текста при потоковом разборе JSON
+READ_SIZE = 64 * 1024
+# Символы, из которых может состоять число JSON
+NUMBER_CHARS = '0123456789+-.eE'
+
+# Префикс колонок CSV со значениями параметров: "param:Цвет"
+CSV_PARAMETER_PREFIX = 'param:'
+
+
+def compose_node(loader, anchors):
+    """
+    Собирает узел YAML из событий парсера.
+    В отличие от loader.get_node() не требует держать в памяти весь документ.
+    """
+    event = loader.get_event()
+    if isinstance(event, yaml.AliasEvent):
+        return anchors[event.anchor]
+
+    if isinstance(event, yaml.ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+        node = yaml.ScalarNode(tag, event.value, event.start_mark,
+                               event.end_mark, style=event.style)
+    elif isinstance(event, yaml.SequenceStartEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.SequenceNode, None, event.implicit)
+        node = yaml.SequenceNode(tag, [], event.start_mark, None,
+                                 flow_style=event.flow_style)
+        while not loader.check_event(yaml.SequenceEndEvent):
+            node.value.append(compose_node(loader, anchors))
+        node.end_mark = loader.get_event().end_mark
+    else:
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.MappingNode, None, event.implicit)
+        node = yaml.MappingNode(tag, [], event.start_mark, None,
+                                flow_style=event.flow_style)
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = compose_node(loader, anchors)
+            node.value.append((key, compose_node(loader, anchors)))
+        node.end_mark = loader.get_event().end_mark
+
+    if event.anchor is not None:
+        anchors[event.anchor] = node
+    return node
+
+
+def iter_yaml_catalog(stream):
+    """
+    Потоково разбирает YAML-прайс и возвращает пары (ключ, значение)
+    верхнего уровня. Список goods отдаётся по одному товару:
+    ('goods', {...}), поэтому в памяти одновременно находится только
+    текущий товар. stream - файлоподобный объект, читаемый кусками.
+    """
+    loader = SafeLoader(stream)
+    try:
+        loader.get_event()
+        if loader.check_event(yaml.StreamEndEvent):
+            return
+        loader.get_event()
+        if not loader.check_event(yaml.MappingStartEvent):
+            raise ValueError('Прайс-лист должен быть словарём')
+        loader.get_event()
+        anchors = {}
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = loader.construct_document(compose_node(loader, anchors))
+            if key == 'goods' and loader.check_event(
+                    yaml.SequenceStartEvent):
+                loader.get_event()
+                while not loader.check_event(yaml.SequenceEndEvent):
+                    yield key, loader.construct_document(
+                        compose_node(loader, anchors))
+                loader.get_event()
+            else:
+                yield key, loader.construct_document(
+                    compose_node(loader, anchors))
+    finally:
+        loader.dispose()
+
+
+class JsonReader:
+    """
+    Читает значения JSON по одному из текстового потока.
+    Буфер дочитывается кусками, разбор значений делает json.JSONDecoder.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+
+    def fill(self):
+        chunk = self.stream.read(READ_SIZE)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Возвращает следующий значащий символ, не сдвигая позицию.
+        """
+        while True:
+            while self.pos < len(self.buffer) and \
+                    self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f'Ошибка разбора JSON: ожидался символ {char}')
+        self.pos += 1
+
+    def items(self, end):
+        """
+        Перебирает элементы объекта или массива до символа end.
+        Между итерациями проверяет, что элементы разделены запятой.
+        """
+        if self.peek() != end:
+            while True:
+                yield
+                if self.peek() != ',':
+                    break
+                self.expect(',')
+        self.expect(end)
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # Число на границе буфера может быть обрезано ("4." от "4.5"),
+            # тогда дочитываем и разбираем заново
+            if isinstance(value, (int, float)) and \
+                    not self.buffer[end:].lstrip(NUMBER_CHARS) and \
+                    self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_catalog(stream):
+    """
+    Потоково разбирает JSON-прайс той же структуры, что и YAML:
+    {"shop": ..., "categories": [...], "goods": [...]}.
+    Товары из goods отдаются по одному.
+    """
+    reader = JsonReader(codecs.getreader('utf-8-sig')(stream))
+    reader.expect('{')
+    for _ in reader.items('}'):
+        key = reader.value()
+        reader.expect(':')
+        if key == 'goods' and reader.peek() == '[':
+            reader.expect('[')
+            for _ in reader.items(']'):
+                yield key, reader.value()
+        else:
+            yield key, reader.value()
+    if reader.peek():
+        raise ValueError('Ошибка разбора JSON: данные после прайс-листа')
+
+
+def iter_ndjson_catalog(stream):
+    """
+    Разбирает прайс в формате NDJSON: по одному объекту JSON в строке.
+    Строки с ключом id - товары, остальные - заголовок
+    ({"shop": ..., "categories": [...]}).
+    """
+    for line in codecs.getreader('utf-8-sig')(stream):
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if 'id' in record:
+            yield 'goods', record
+        else:
+            yield from record.items()
+
+
+def iter_csv_catalog(stream):
+    """
+    Разбирает прайс в формате CSV: одна строка - один товар.
+    Колонки: id, category, category_name, model, name, price, price_rrc,
+    quantity, необязательная shop и колонки параметров "param:<название>".
+    Если колонки shop нет, товары загружаются в магазин пользователя.
+    """
+    reader = csv.DictReader(codecs.getreader('utf-8-sig')(stream))
+    categories = set()
+    shop = None
+    for row in reader:
+        if shop is None and row.get('shop'):
+            shop = row['shop']
+            yield 'shop', shop
+        category = int(row['category'])
+        if category not in categories:
+            categories.add(category)
+            if row.get('category_name'):
+                yield 'categories', [{'id': category,
+                                      'name': row['category_name']}]
+        yield 'goods', {
+            'id': int(row['id']),
+            'category': category,
+            'model': row.get('model') or None,
+            'name': row['name'],
+            'price': row['price'],
+            'price_rrc': row['price_rrc'],
+            'quantity': int(row['quantity']),
+            'parameters': {
+                name[len(CSV_PARAMETER_PREFIX):]: value
+                for name, value in row.items()
+                if name.startswith(CSV_PARAMETER_PREFIX) and value},
+        }
+
+
+# Потоковые парсеры прайс-листов по форматам
+PARSERS = {
+    'yaml': iter_yaml_catalog,
+    'json': iter_json_catalog,
+    'ndjson': iter_ndjson_catalog,
+    'csv': iter_csv_catalog,
+}
+
+CONTENT_TYPES = {
+    'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+    'application/yaml': 'yaml',
+    'application/x-yaml': 'yaml',
+    'text/yaml': 'yaml',
+    'text/x-yaml': 'yaml',
+}
+
+EXTENSIONS = {
+    '.json': 'json',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.csv': 'csv',
+    '.yaml': 'yaml',
+    '.yml': 'yaml',
+}
+
+
+def detect_format(url, content_type=None):
+    """
+    Определяет формат прайс-листа по Content-Type ответа,
+    а если он не подходит - по расширению файла в ссылке.
+    По умолчанию прайс-лист считается YAML.
+    """
+    if content_type:
+        content_type = content_type.split(';')[0].strip().lower()
+        if content_type in CONTENT_TYPES:
+            return CONTENT_TYPES[content_type]
+    extension = os.path.splitext(urlparse(url).path)[1].lower()
+    return EXTENSIONS.get(extension, 'yaml')
@@ -0,0 +1,24 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, \
+    TrigramWordSimilarity
+from django.db.models import F, Q
+
+from backend.catalog import SEARCH_CONFIG
+
+# Наибольшее количество результатов поиска в одном ответе
+MAX_RESULTS = 100
+
+
+def search_products(queryset, text):
+    """
+    Ищет строки витрины каталога по словам запроса (индекс GIN по
+    tsvector) или, если слова написаны с опечатками, по похожести
+    триграмм (индекс GIN gin_trgm_ops). Сначала идут самые релевантные.
+    """
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(
+        Q(search_vector=query) |
+        Q(search_document__trigram_word_similar=text)
+    ).annotate(
+        rank=SearchRank(F('search_vector'), query) +
+        TrigramWordSimilarity(text, 'search_document')
+    ).order_by('-rank', 'pk')
@@ -1,6 +1,10 @@
+from functools import cache
+
+from django.db.models import Prefetch
 from rest_framework import serializers
 from backend.models import Contact, Order, OrderItem, User, Product, \
-    ProductInfo, Shop, Category, Parameter, ProductParameter
+    ProductInfo, Shop, Category, Parameter, ProductParameter, ImportJob, \
+    CatalogEntry
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -64,6 +68,215 @@ class ProductInfoSerializer(serializers.ModelSerializer):
                   'shop_detail']
 
 
+@cache
+def fields_shape(serializer_class):
+    """
+    Дерево доступных для чтения полей сериализатора, например
+    {'id': {}, 'product_detail': {'id': {}, 'name': {}, ...}, ...}.
+    """
+    def shape(serializer):
+        if isinstance(serializer, serializers.ListSerializer):
+            serializer = serializer.child
+        return {name: shape(field)
+                if isinstance(field, serializers.BaseSerializer) else {}
+                for name, field in serializer.fields.items()
+                if not field.write_only}
+    return shape(serializer_class())
+
+
+def parse_fields(value, shape):
+    """
+    Разбирает ?fields=id,price,product_detail.name в дерево
+    {'id': None, 'price': None, 'product_detail': {'name': None}}.
+    None означает поле целиком, в том числе весь вложенный объект.
+    Без параметра возвращает None - все поля. При неизвестном поле
+    выбрасывает ValueError.
+    """
+    if not value:
+        return None
+    tree = {}
+    for path in value.split(','):
+        path = path.strip()
+        if not path:
+            continue
+        node, allowed = tree, shape
+        parts = path.split('.')
+        for depth, part in enumerate(parts, 1):
+            if part not in allowed:
+                raise ValueError(f'Неизвестное поле: {path}')
+            allowed = allowed[part]
+            if depth == len(parts):
+                node[part] = None
+            elif part in node and node[part] is None:
+                break
+            else:
+                node = node.setdefault(part, {})
+    if not tree:
+        raise ValueError('Не указаны поля')
+    return tree
+
+
+def selected(fields, *path):
+    """
+    Попадает ли поле по пути path в выборку fields (см. parse_fields).
+    """
+    for part in path:
+        if fields is None:
+            return True
+        if part not in fields:
+            return False
+        fields = fields[part]
+    return True
+
+
+def prune_fields(serializer, fields):
+    """
+    Убирает из сериализатора и вложенных сериализаторов поля,
+    не попавшие в выборку.
+    """
+    if fields is None:
+        return
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    for name in list(serializer.fields):
+        field = serializer.fields[name]
+        if name not in fields:
+            serializer.fields.pop(name)
+        elif isinstance(field, serializers.BaseSerializer):
+            prune_fields(field, fields[name])
+
+
+def pick(data, fields):
+    """
+    Оставляет в готовом словаре (или списке словарей) выбранные поля.
+    """
+    if fields is None or data is None:
+        return data
+    if isinstance(data, list):
+        return [pick(item, fields) for item in data]
+    return {name: pick(value, fields[name])
+            for name, value in data.items() if name in fields}
+
+
+class SparseFieldsMixin:
+    """
+    Выводит только поля, выбранные в context['fields'].
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        prune_fields(self, self.context.get('fields'))
+
+
+def catalog_context(entries, fields=None):
+    """
+    Загружает магазины для страницы витрины: магазины самих предложений и
+    магазины их категорий. Не больше трёх небольших запросов на страницу
+    независимо от её размера; не попавшее в выборку fields не загружается.
+    """
+    category_shops = {}
+    if selected(fields, 'product_detail', 'category', 'shops'):
+        category_ids = {entry.category_id for entry in entries}
+        for category_id, shop_id in Category.shops.through.objects.filter(
+                category_id__in=category_ids).order_by(
+                'shop_id').values_list('category_id', 'shop_id'):
+            category_shops.setdefault(category_id, []).append(shop_id)
+
+    shop_ids = set()
+    if selected(fields, 'shop_detail'):
+        shop_ids = {entry.shop_id for entry in entries}
+    for ids in category_shops.values():
+        shop_ids.update(ids)
+    shop_data = []
+    if shop_ids:
+        shops = Shop.objects.filter(id__in=shop_ids)
+        with_categories = selected(
+            fields, 'shop_detail', 'categories') or selected(
+            fields, 'product_detail', 'category', 'shops', 'categories')
+        if with_categories:
+            shops = shops.prefetch_related('categories')
+        serializer = ShopSerializer(shops, many=True)
+        if not with_categories:
+            prune_fields(serializer, {'id': None, 'name': None, 'url': None})
+        shop_data = serializer.data
+    return {'fields': fields,
+            'shops': {shop['id']: shop for shop in shop_data},
+            'category_shops': category_shops}
+
+
+# Столбцы витрины, которые читает каждое поле CatalogEntrySerializer
+CATALOG_FIELD_COLUMNS = {
+    'id': [],
+    'product': ['product_id'],
+    'shop': ['shop_id'],
+    'model': ['model'],
+    'quantity': ['quantity'],
+    'price': ['price'],
+    'price_rrc': ['price_rrc'],
+    'product_detail': ['product_id', 'product_name', 'category_id',
+                       'category_name'],
+    'shop_detail': ['shop_id'],
+}
+
+
+def catalog_queryset(fields=None):
+    """
+    Строки витрины только со столбцами, нужными выбранным полям.
+    """
+    if fields is None:
+        return CatalogEntry.objects.defer('search_document', 'search_vector')
+    columns = {'product_info'}
+    for name in fields:
+        columns.update(CATALOG_FIELD_COLUMNS[name])
+    return CatalogEntry.objects.only(*columns)
+
+
+class CatalogEntrySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Строка витрины каталога в том же виде, что и ProductInfoSerializer.
+    Магазины берутся из контекста, собранного catalog_context.
+    """
+    id = serializers.IntegerField(source='pk', read_only=True)
+    product = serializers.IntegerField(source='product_id', read_only=True)
+    shop = serializers.IntegerField(source='shop_id', read_only=True)
+    product_detail = serializers.SerializerMethodField()
+    shop_detail = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CatalogEntry
+        fields = ['id',
+                  'product',
+                  'shop',
+                  'model',
+                  'quantity',
+                  'price',
+                  'price_rrc',
+                  'product_detail',
+                  'shop_detail']
+
+    def subfields(self, name):
+        fields = self.context.get('fields')
+        return None if fields is None else fields[name]
+
+    def get_product_detail(self, entry):
+        shops = self.context['shops']
+        return pick({
+            'id': entry.product_id,
+            'name': entry.product_name,
+            'category': {
+                'id': entry.category_id,
+                'name': entry.category_name,
+                'shops': [shops[shop_id] for shop_id in
+                          self.context['category_shops'].get(
+                              entry.category_id, [])],
+            },
+        }, self.subfields('product_detail'))
+
+    def get_shop_detail(self, entry):
+        return pick(self.context['shops'][entry.shop_id],
+                    self.subfields('shop_detail'))
+
+
 class ParameterSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -78,20 +291,64 @@ class ProductParameterSerializer(serializers.ModelSerializer):
         fields = ['id', 'product_info', 'parameter', 'value']
 
 
+# Связи позиции заказа, нужные полям OrderItemSerializer:
+# (путь поля, select_related, prefetch_related)
+ORDER_ITEM_RELATIONS = [
+    (('product',), 'product', None),
+    (('product', 'product_detail'), 'product__product', None),
+    (('product', 'product_detail', 'category'),
+     'product__product__category', None),
+    (('product', 'product_detail', 'category', 'shops'),
+     None, 'product__product__category__shops'),
+    (('product', 'product_detail', 'category', 'shops', 'categories'),
+     None, 'product__product__category__shops__categories'),
+    (('product', 'shop_detail'), 'product__shop', None),
+    (('product', 'shop_detail', 'categories'),
+     None, 'product__shop__categories'),
+    (('shop',), 'shop', None),
+    (('shop', 'categories'), None, 'shop__categories'),
+]
+
+
+def with_order_details(queryset, fields=None):
+    """
+    Загружает для OrderSerializer всё, что читают вложенные
+    ProductInfoSerializer и ShopSerializer: позиции с товаром, категорией
+    и магазинами одним запросом, а магазины категорий и категории
+    магазинов - отдельными. Число запросов не зависит от количества
+    заказов и позиций. Связи полей, не попавших в выборку fields,
+    не загружаются. Позиции идут в порядке добавления.
+    """
+    if selected(fields, 'user'):
+        queryset = queryset.select_related('user')
+    if not selected(fields, 'items'):
+        return queryset
+    item_fields = None if fields is None else fields['items']
+    related = [join for path, join, _ in ORDER_ITEM_RELATIONS
+               if join and selected(item_fields, *path)]
+    prefetch = [lookup for path, _, lookup in ORDER_ITEM_RELATIONS
+                if lookup and selected(item_fields, *path)]
+    items = OrderItem.objects.order_by('id')
+    if related:
+        items = items.select_related(*related)
+    return queryset.prefetch_related(
+        Prefetch('items', queryset=items.prefetch_related(*prefetch)))
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     product = ProductInfoSerializer(read_only=True)
     shop = ShopSerializer(read_only=True)
 
     class Meta:
         model = OrderItem
-        fields = ['id', 'product', 'quantity', 'shop']
+        fields = ['id', 'product', 'quantity', 'price', 'shop']
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     user = UserSerializer(read_only=True)
     total_sum = serializers.DecimalField(
-        max_digits=10, decimal_places=2, read_only=True)
+        max_digits=12, decimal_places=2, read_only=True)
 
     class Meta:
         model = Order
@@ -103,3 +360,32 @@ class ContactSerializer(serializers.ModelSerializer):
     class Meta:
         model = Contact
         fields = ['id', 'type', 'value']
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+    timings = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = ['id', 'url', 'shop', 'state', 'goods_total',
+                  'goods_processed', 'bytes_total', 'bytes_read', 'progress',
+                  'inserted', 'updated', 'deleted', 'timings', 'error',
+                  'created_at', 'finished_at']
+
+    def get_progress(self, obj):
+        if obj.goods_total:
+            return round(obj.goods_processed / obj.goods_total, 4)
+        if not obj.bytes_total or not obj.bytes_read or not obj.goods_read:
+            return None
+        # Пока прайс-лист читается, число товаров в нём оценивается
+        # по доле прочитанных байт
+        estimate = obj.goods_read * obj.bytes_total / obj.bytes_read
+        return round(min(obj.goods_processed / estimate, 1), 4)
+
+    def get_timings(self, obj):
+        return {'fetch': obj.fetch_time,
+                'parse': obj.parse_time,
+                'resolve': obj.resolve_time,
+                'write': obj.write_time,
+                'publish': obj.publish_time}
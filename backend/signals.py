@@ -1,5 +1,5 @@
 
-from backend.models import ConfirmEmailToken
+from backend.models import ConfirmEmailToken, OrderShopTotal
 from django.dispatch import Signal, receiver
 from django.conf import settings
 from backend.tasks import send_email
@@ -12,11 +12,11 @@ new_order_status = Signal()
 
 
 def generate_invoice_text(order, shop):
-    items = order.items.filter(shop=shop).select_related(
-        'product__product', 'shop')
+    items = order.items.filter(shop=shop).select_related('product__product')
 
-    # Вычисление итоговой суммы заказа
-    total_sum = sum(item.quantity * item.product.price for item in items)
+    # Итоговая сумма сохранена при оформлении заказа
+    total_sum = OrderShopTotal.objects.filter(
+        order=order, shop=shop).values_list('total_sum', flat=True).first()
 
     return render_to_string(
         'invoice.txt',
@@ -0,0 +1,175 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+
+from backend.models import Order
+
+# Сколько раз повторяется оформление заказа, если транзакцию прервала
+# взаимная блокировка с другим покупателем
+RESERVE_ATTEMPTS = 3
+
+# Ключ кеша: смена версий каталога магазина после изменения остатков
+# уже запланирована
+STOCK_VERSION_KEY = 'catalog:stock:{}'
+
+# Списывает остатки по всем строкам заказа одним запросом. Строка
+# списывается, только если остатка хватает, поэтому покупатели не ждут
+# друг друга дольше одного UPDATE. Витрина каталога получает новые
+# остатки в том же запросе
+RESERVE_SQL = """
+    WITH reserved AS (
+        UPDATE backend_productinfo AS info
+        SET quantity = info.quantity - line.quantity
+        FROM backend_orderitem AS line
+        WHERE line.order_id = %(order)s
+          AND info.id = line.product_id
+          AND info.quantity >= line.quantity
+        RETURNING info.id, info.quantity, info.shop_id
+    ), catalog AS (
+        UPDATE backend_catalogentry AS entry
+        SET quantity = reserved.quantity
+        FROM reserved
+        WHERE entry.product_info_id = reserved.id
+    )
+    SELECT * FROM reserved
+"""
+
+# Возвращает остатки по всем строкам заказа на склад
+RELEASE_SQL = """
+    WITH released AS (
+        UPDATE backend_productinfo AS info
+        SET quantity = info.quantity + line.quantity
+        FROM backend_orderitem AS line
+        WHERE line.order_id = %(order)s
+          AND info.id = line.product_id
+        RETURNING info.id, info.quantity, info.shop_id
+    ), catalog AS (
+        UPDATE backend_catalogentry AS entry
+        SET quantity = released.quantity
+        FROM released
+        WHERE entry.product_info_id = released.id
+    )
+    SELECT * FROM released
+"""
+
+# Цены строк, у которых их ещё нет, берутся из каталога
+SNAPSHOT_PRICES_SQL = """
+    UPDATE backend_orderitem AS line
+    SET price = info.price
+    FROM backend_productinfo AS info
+    WHERE line.order_id = %(order)s
+      AND line.price IS NULL
+      AND info.id = line.product_id
+"""
+
+# Суммы заказа по магазинам и общая сумма по сохранённым ценам строк
+ORDER_TOTALS_SQL = """
+    WITH shop_totals AS (
+        SELECT shop_id, sum(quantity * price) AS total_sum
+        FROM backend_orderitem
+        WHERE order_id = %(order)s
+        GROUP BY shop_id
+    ), removed AS (
+        DELETE FROM backend_ordershoptotal
+        WHERE order_id = %(order)s
+          AND shop_id NOT IN (SELECT shop_id FROM shop_totals)
+    ), saved AS (
+        INSERT INTO backend_ordershoptotal (order_id, shop_id, total_sum)
+        SELECT %(order)s, shop_id, total_sum FROM shop_totals
+        ON CONFLICT (order_id, shop_id) DO UPDATE
+        SET total_sum = EXCLUDED.total_sum
+    )
+    UPDATE backend_order
+    SET total_sum = (SELECT coalesce(sum(total_sum), 0) FROM shop_totals)
+    WHERE id = %(order)s
+"""
+
+
+def update_order_totals(order_id):
+    """
+    Запоминает цены строк заказа и пересчитывает суммы заказа
+    по магазинам и общую. Вызывается при оформлении и правке заказа,
+    чтобы списки заказов и накладные читали готовые суммы.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(SNAPSHOT_PRICES_SQL, {'order': order_id})
+        cursor.execute(ORDER_TOTALS_SQL, {'order': order_id})
+
+
+def stock_changed(rows):
+    """
+    Планирует смену версии каталога и ETag выгрузки магазинов, чьи
+    остатки изменились. Версии меняются задачей после фиксации транзакции
+    и не чаще раза в STOCK_VERSION_DELAY секунд на магазин: UPDATE
+    магазина внутри оформления выстраивал бы покупателей в очередь
+    за блокировкой его строки, а сброс кеша на каждый заказ обесценивал
+    бы кеш каталога. Поэтому закешированные ответы и выгрузки показывают
+    остатки с опозданием до STOCK_VERSION_DELAY секунд.
+    """
+    shop_ids = {row[2] for row in rows}
+    if shop_ids:
+        transaction.on_commit(lambda: schedule_stock_versions(shop_ids))
+
+
+def schedule_stock_versions(shop_ids):
+    from backend.tasks import bump_stock_versions
+
+    delay = settings.STOCK_VERSION_DELAY
+    for shop_id in sorted(shop_ids):
+        # Пока задача магазина не выполнена, новые изменения остатков
+        # её не дублируют. Срок ключа страхует от потерянной задачи
+        if cache.add(STOCK_VERSION_KEY.format(shop_id), 1,
+                     timeout=delay * 10 + 60):
+            bump_stock_versions.apply_async((shop_id,), countdown=delay)
+
+
+def confirm_order(order):
+    """
+    Оформляет корзину: переводит заказ в статус new, запоминает цены
+    и суммы и списывает остатки в одной короткой транзакции. Если
+    какой-то позиции не хватает или корзина уже оформлена, ничего
+    не меняется и выбрасывается ValueError. При взаимной блокировке
+    транзакция повторяется до RESERVE_ATTEMPTS раз.
+    """
+    reserve = settings.RESERVE_STOCK
+    products = set(order.items.values_list('product_id', flat=True))
+    for attempt in range(1, RESERVE_ATTEMPTS + 1):
+        try:
+            with transaction.atomic():
+                if not Order.objects.filter(
+                        id=order.id, status='basket').update(
+                        status='new', stock_reserved=reserve):
+                    raise ValueError('Корзина уже оформлена')
+                update_order_totals(order.id)
+                if reserve:
+                    with connection.cursor() as cursor:
+                        cursor.execute(RESERVE_SQL, {'order': order.id})
+                        rows = cursor.fetchall()
+                    short = products - {row[0] for row in rows}
+                    if short:
+                        raise ValueError(
+                            f'Недостаточно товара на складе: '
+                            f'{", ".join(map(str, sorted(short)))}')
+                    stock_changed(rows)
+            break
+        except OperationalError:
+            if attempt == RESERVE_ATTEMPTS:
+                raise
+    order.status = 'new'
+    order.stock_reserved = reserve
+
+
+def release_stock(order):
+    """
+    Возвращает на склад остатки отменённого заказа. Срабатывает один раз:
+    отметка stock_reserved снимается в той же транзакции.
+    """
+    with transaction.atomic():
+        if not Order.objects.filter(
+                id=order.id, stock_reserved=True).update(
+                stock_reserved=False):
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(RELEASE_SQL, {'order': order.id})
+            stock_changed(cursor.fetchall())
+    order.stock_reserved = False
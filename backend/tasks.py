@@ -1,6 +1,6 @@
 from celery import shared_task
 from django.core.mail import EmailMultiAlternatives
-from django.conf import settings
+from django.utils import timezone
 
 
 # Асинхронная задача для отправки email
@@ -14,51 +14,101 @@ def send_email(subject, message, from_email, to_email):
         return f'Failed to send email:{str(e)}'
 
 
-# Асинхронная задача для импорта данных из YAML по URL
+# Асинхронная задача для импорта прайс-листа (YAML, JSON, NDJSON, CSV)
+# по URL
 @shared_task
-def do_import(url, user_id):
-    from django.core.exceptions import ValidationError
-    from backend.models import Shop, Category, Product, ProductInfo, \
-        Parameter, ProductParameter, User
-    import yaml
-    import requests
+def do_import(url, user_id, job_id=None, catalog_format=None):
+    from backend.models import User
+    from backend.importer import import_url, ImportProgress
 
+    progress = ImportProgress(job_id)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = yaml.safe_load(response.content)
+        progress.save(state='running')
+        user = User.objects.get(id=user_id)
+        result = import_url(url, user.id, progress=progress,
+                            catalog_format=catalog_format)
+        return {'status': True, **result}
+    except Exception as e:
+        progress.save(state='failed', error=str(e),
+                      finished_at=timezone.now())
+        return {'status': False,
+                'error': f'Ошибка загрузки прайс-листа: {str(e)}'}
+
 
+# Параллельный импорт: прайс-лист делится на пачки,
+# которые записываются в черновик разными воркерами
+@shared_task
+def do_parallel_import(url, user_id, job_id=None, catalog_format=None):
+    from backend.models import User
+    from backend.importer import import_url, ImportProgress, \
+        ParallelCatalogImporter, CHUNK_SIZE
+
+    progress = ImportProgress(job_id)
+    try:
+        progress.save(state='running')
         user = User.objects.get(id=user_id)
+        result = import_url(url, user.id, progress=progress,
+                            catalog_format=catalog_format,
+                            importer_class=ParallelCatalogImporter,
+                            batch_size=CHUNK_SIZE)
+        return {'status': True, **result}
+    except Exception as e:
+        progress.save(state='failed', error=str(e),
+                      finished_at=timezone.now())
+        return {'status': False,
+                'error': f'Ошибка загрузки прайс-листа: {str(e)}'}
+
 
-        shop, _ = Shop.objects.get_or_create(name=data['shop'],
-                                             user_id=user.id)
-        for category in data.get('categories', []):
-            category_obj, _ = Category.objects.get_or_create(
-                id=category['id'],
-                name=category['name'])
-            category_obj.shops.add(shop)
-
-        ProductInfo.objects.filter(shop_id=shop.id).delete()
-
-        for item in data.get('goods', []):
-            product, _ = Product.objects.get_or_create(
-                name=item['name'],
-                category_id=item['category'])
-            product_info = ProductInfo.objects.create(
-                product_id=product.id,
-                external_id=item['id'],
-                model=item['model'],
-                price=item['price'],
-                price_rrc=item['price_rrc'],
-                quantity=item['quantity'],
-                shop_id=shop.id
-            )
-            for name, value in item.get('parameters', {}).items():
-                parameter, _ = Parameter.objects.get_or_create(name=name)
-                ProductParameter.objects.create(
-                    product_info_id=product_info.id,
-                    parameter_id=parameter.id,
-                    value=value)
-        return {'status': True}
+# Пачка товаров параллельного импорта: запись в черновик.
+# Последняя записанная пачка запускает finish_import
+@shared_task
+def import_goods_chunk(shop_id, token, goods, parameters, source=None,
+                       job_id=None):
+    from backend.models import ImportJob, Shop
+    from backend.importer import ParallelCatalogImporter, ImportProgress
+
+    if ImportJob.objects.filter(id=job_id, state='failed').exists():
+        return 0
+    importer = ParallelCatalogImporter(
+        Shop.objects.get(id=shop_id), source, token, ImportProgress(job_id))
+    importer.parameters = parameters
+    try:
+        importer.stage_chunk(goods)
     except Exception as e:
-        return {'status': False, 'error': f'Ошибка загрузки yaml: {str(e)}'}
+        importer.fail(e)
+        raise
+    return len(goods)
+
+
+# Завершение параллельного импорта: публикация черновика одной
+# транзакцией, удаление пропавших позиций и новая версия каталога магазина
+@shared_task
+def finish_import(shop_id, token, source=None, job_id=None):
+    from backend.models import Shop
+    from backend.importer import ParallelCatalogImporter, ImportProgress
+
+    importer = ParallelCatalogImporter(
+        Shop.objects.get(id=shop_id), source, token, ImportProgress(job_id))
+    try:
+        return importer.finish_chunks()
+    except Exception as e:
+        importer.fail(e)
+        raise
+
+
+# Смена версий каталога после изменения остатков магазина при оформлении
+# и отмене заказов. Планируется не чаще раза в STOCK_VERSION_DELAY секунд
+@shared_task
+def bump_stock_versions(shop_id):
+    from django.core.cache import cache
+    from django.db.models import F
+    from backend.cache import bump_catalog_version
+    from backend.models import Shop
+    from backend.stock import STOCK_VERSION_KEY
+
+    # Ключ снимается до смены версий: изменения остатков после этого
+    # запланируют следующую смену, а не потеряются
+    cache.delete(STOCK_VERSION_KEY.format(shop_id))
+    Shop.objects.filter(id=shop_id).update(
+        catalog_version=F('catalog_version') + 1)
+    bump_catalog_version()
@@ -1,3 +1,1239 @@
-from django.test import TestCase
+import hashlib
+import io
+import itertools
+import json
+import os
+import tempfile
+from datetime import datetime
+from unittest import mock
 
-# Create your tests here.
+import yaml
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from backend.benchmark import write_catalog
+from backend.importer import CatalogImporter, ImportProgress, \
+    ParallelCatalogImporter, import_file, import_url
+from backend.cache import cache_stats, catalog_version
+from backend.models import CatalogEntry, Category, Contact, ImportJob, \
+    Order, OrderItem, Product, ProductInfo, Shop, StagedOfferIds, \
+    StagedProductInfo, User
+from backend.pagination import ProductCursorPagination
+from backend.parsers import PARSERS
+from backend.search import MAX_RESULTS, search_products
+from backend.serializers import ImportJobSerializer, catalog_queryset
+from backend.stock import update_order_totals
+from backend.tasks import bump_stock_versions
+from backend.views import filter_products
+from orders.celery import app
+
+
+def goods_item(external_id, name='Телефон', category=1, price=100,
+               quantity=10, **parameters):
+    """
+    Позиция прайс-листа в том виде, в каком её отдают парсеры.
+    """
+    return {'id': external_id, 'name': name, 'category': category,
+            'model': f'model-{external_id}', 'price': price,
+            'price_rrc': price, 'quantity': quantity,
+            'parameters': parameters}
+
+
+def import_goods(shop, goods, categories=({'id': 1, 'name': 'Смартфоны'},)):
+    """
+    Загружает прайс-лист магазина так же, как задача импорта.
+    """
+    importer = CatalogImporter(shop)
+    importer.add_categories(list(categories))
+    if goods:
+        importer.add_goods([dict(item) for item in goods])
+    return importer.finish()
+
+
+# Позиции, пропавшие из прайс-листа
+class StaleOffersTest(TestCase):
+
+    def setUp(self):
+        self.shop = Shop.objects.create(name='Связной')
+        self.buyer = User.objects.create_user('buyer@example.com', 'pass')
+        import_goods(self.shop, [goods_item(1), goods_item(2),
+                                 goods_item(3)])
+        self.offers = dict(ProductInfo.objects.values_list(
+            'external_id', 'id'))
+
+    def order_offer(self, external_id, status):
+        order = Order.objects.create(user=self.buyer, status=status)
+        return OrderItem.objects.create(
+            order=order, product_id=self.offers[external_id],
+            shop=self.shop, quantity=1)
+
+    def test_ordered_offer_is_archived(self):
+        line = self.order_offer(1, 'confirmed')
+        basket_line = self.order_offer(2, 'basket')
+
+        stats = import_goods(self.shop, [goods_item(3)])
+
+        self.assertEqual(stats['deleted'], 2)
+        self.assertTrue(OrderItem.objects.filter(id=line.id).exists())
+        self.assertFalse(
+            OrderItem.objects.filter(id=basket_line.id).exists())
+        offer = ProductInfo.objects.get(id=self.offers[1])
+        self.assertTrue(offer.archived)
+        self.assertEqual(offer.quantity, 0)
+        self.assertFalse(ProductInfo.objects.filter(
+            id=self.offers[2]).exists())
+        self.assertEqual(
+            list(CatalogEntry.objects.values_list('product_info_id',
+                                                  flat=True)),
+            [self.offers[3]])
+
+    def test_archived_offer_returns(self):
+        self.order_offer(1, 'new')
+        import_goods(self.shop, [goods_item(3)])
+
+        stats = import_goods(self.shop, [goods_item(1), goods_item(3)])
+
+        self.assertEqual(stats, {'inserted': 0, 'updated': 1,
+                                 'deleted': 0})
+        offer = ProductInfo.objects.get(id=self.offers[1])
+        self.assertFalse(offer.archived)
+        self.assertEqual(offer.quantity, 10)
+        self.assertEqual(CatalogEntry.objects.get(
+            product_info_id=offer.id).quantity, 10)
+
+
+# Повторный импорт пишет в черновик только изменившиеся позиции
+class UnchangedOffersTest(TestCase):
+
+    def setUp(self):
+        self.shop = Shop.objects.create(name='Связной')
+        import_goods(self.shop, [goods_item(1), goods_item(2),
+                                 goods_item(3, color='чёрный')])
+
+    def reimport(self, goods):
+        with mock.patch.object(CatalogImporter, 'stage',
+                               autospec=True,
+                               side_effect=CatalogImporter.stage) as stage:
+            stats = import_goods(self.shop, goods)
+        staged = [item['id'] for call in stage.call_args_list
+                  for item in call.args[1]]
+        return stats, staged
+
+    def test_only_changed_offer_is_staged(self):
+        stats, staged = self.reimport([
+            goods_item(1), goods_item(2, price=150),
+            goods_item(3, color='чёрный')])
+
+        self.assertEqual(staged, [2])
+        self.assertEqual(stats, {'inserted': 0, 'updated': 1,
+                                 'deleted': 0})
+        self.assertEqual(
+            ProductInfo.objects.get(external_id=2).price, 150)
+
+    def test_price_in_other_notation_is_not_staged(self):
+        stats, staged = self.reimport([
+            goods_item(1, price=100.0), goods_item(2, price='100.00'),
+            goods_item(3, color='чёрный')])
+
+        self.assertEqual(staged, [])
+        self.assertEqual(stats, {'inserted': 0, 'updated': 0,
+                                 'deleted': 0})
+
+    def test_changed_parameter_is_staged(self):
+        stats, staged = self.reimport([
+            goods_item(1), goods_item(2), goods_item(3, color='белый')])
+
+        self.assertEqual(staged, [3])
+        self.assertEqual(CatalogEntry.objects.get(
+            product_info__external_id=3).parameters, {'color': 'белый'})
+
+    def test_quantity_changed_outside_import_is_restored(self):
+        ProductInfo.objects.filter(external_id=1).update(quantity=7)
+
+        stats, staged = self.reimport([
+            goods_item(1), goods_item(2), goods_item(3, color='чёрный')])
+
+        self.assertEqual(staged, [1])
+        self.assertEqual(ProductInfo.objects.get(external_id=1).quantity, 10)
+
+    def test_missing_offer_is_removed_without_staging(self):
+        stats, staged = self.reimport([goods_item(1), goods_item(2)])
+
+        self.assertEqual(staged, [])
+        self.assertEqual(stats['deleted'], 1)
+        self.assertEqual(
+            sorted(ProductInfo.objects.values_list('external_id',
+                                                   flat=True)), [1, 2])
+        self.assertFalse(StagedOfferIds.objects.exists())
+
+
+# Данные загрузки, которые импорт запоминает в магазине
+class ImportSourceTest(TestCase):
+
+    def test_long_url_is_saved(self):
+        shop = Shop.objects.create(name='Связной')
+        url = 'https://example.com/' + 'a' * 460 + '/shop.yaml'
+        importer = CatalogImporter(shop, {'url': url, 'import_hash': 'x'})
+        importer.add_categories([{'id': 1, 'name': 'Смартфоны'}])
+        importer.add_goods([goods_item(1)])
+        importer.finish()
+
+        shop.refresh_from_db()
+        self.assertEqual(len(shop.url), 490)
+        self.assertEqual(shop.url, url)
+
+    def test_unknown_category_is_reported(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'shop.csv')
+            with open(path, 'w', encoding='utf-8') as payload:
+                payload.write('id,category,model,name,price,price_rrc,'
+                              'quantity,shop\r\n'
+                              '1,42,a-1,Телефон,100,100,10,Связной\r\n')
+
+            with self.assertRaisesMessage(
+                    ValueError, 'Неизвестная категория 42 у товара 1'):
+                import_file(path)
+
+        self.assertFalse(ProductInfo.objects.exists())
+
+    def test_export_is_imported_back(self):
+        user = User.objects.create_user('shop@example.com', 'pass',
+                                        type='shop')
+        shop = Shop.objects.create(name='Связной', user=user)
+        import_goods(shop, [goods_item(1, color='чёрный'), goods_item(2)])
+        client = APIClient()
+        client.force_authenticate(user)
+
+        exported = yaml.safe_load(
+            client.get(reverse('partner_export')).content)
+
+        self.assertEqual(list(exported), ['shop', 'categories', 'goods'])
+        # Старые выгрузки шли с сортировкой ключей: goods раньше shop
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'shop.yaml')
+            with open(path, 'w', encoding='utf-8') as payload:
+                yaml.dump(exported, payload, allow_unicode=True)
+            for user_id in (user.id, None):
+                with self.subTest(user_id=user_id):
+                    result = import_file(path, user_id, batch_size=1)
+
+                    self.assertEqual(
+                        (result['shop'], result['inserted'],
+                         result['updated'], result['deleted']),
+                        ('Связной', 0, 0, 0))
+        self.assertEqual(Shop.objects.count(), 1)
+
+    def test_price_without_shop_is_rejected(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'shop.json')
+            with open(path, 'w', encoding='utf-8') as payload:
+                json.dump({'goods': [goods_item(1)]}, payload)
+
+            with self.assertRaisesMessage(
+                    ValueError, 'В прайс-листе не указан магазин (shop)'):
+                import_file(path)
+
+
+# Загрузка прайс-листа по ссылке: условный запрос и хеш содержимого
+class ImportUrlTest(TestCase):
+    URL = 'https://example.com/shop.yaml'
+    PRICE = yaml.dump({'shop': 'Связной',
+                       'categories': [{'id': 1, 'name': 'Смартфоны'}],
+                       'goods': [goods_item(1), goods_item(2)]},
+                      allow_unicode=True, sort_keys=False).encode()
+
+    def setUp(self):
+        self.user = User.objects.create_user('shop@example.com', 'pass',
+                                             type='shop')
+
+    def fetch(self, status=200, body=PRICE, **headers):
+        """
+        Загружает прайс-лист, подменяя ответ сервера магазина.
+        Возвращает результат и заголовки отправленного запроса.
+        """
+        response = mock.Mock(status_code=status, headers=headers)
+        response.iter_content.return_value = [body[:100], body[100:]]
+        with mock.patch('backend.importer.session.get') as get:
+            get.return_value.__enter__.return_value = response
+            result = import_url(self.URL, self.user.id)
+        return result, get.call_args.kwargs['headers']
+
+    def test_first_import_stores_validators(self):
+        result, headers = self.fetch(ETag='"v1"',
+                                     **{'Last-Modified': 'Mon, 01 Jan 2024'})
+
+        self.assertEqual(headers, {})
+        self.assertEqual((result['shop'], result['inserted']), ('Связной', 2))
+        shop = Shop.objects.get(user=self.user)
+        self.assertEqual(
+            (shop.url, shop.import_etag, shop.import_last_modified,
+             shop.import_hash),
+            (self.URL, '"v1"', 'Mon, 01 Jan 2024',
+             hashlib.sha256(self.PRICE).hexdigest()))
+
+    def test_not_modified_is_skipped(self):
+        self.fetch(ETag='"v1"', **{'Last-Modified': 'Mon, 01 Jan 2024'})
+        version = Shop.objects.get().catalog_version
+
+        result, headers = self.fetch(status=304, body=b'')
+
+        self.assertEqual(headers, {'If-None-Match': '"v1"',
+                                   'If-Modified-Since': 'Mon, 01 Jan 2024'})
+        self.assertEqual(result, {'skipped': True,
+                                  'reason': 'not_modified'})
+        self.assertEqual(Shop.objects.get().catalog_version, version)
+
+    def test_unchanged_body_is_skipped(self):
+        self.fetch(ETag='"v1"')
+        version = Shop.objects.get().catalog_version
+
+        with mock.patch.object(CatalogImporter, 'add_goods') as add_goods:
+            result, _ = self.fetch(ETag='"v2"')
+
+        self.assertEqual(result, {'skipped': True, 'reason': 'unchanged'})
+        add_goods.assert_not_called()
+        shop = Shop.objects.get()
+        self.assertEqual(shop.catalog_version, version)
+        # Новый ETag запоминается для следующего условного запроса
+        self.assertEqual((shop.import_etag, shop.import_last_modified),
+                         ('"v2"', ''))
+
+
+# Потоковые парсеры прайс-листов
+class ParsersTest(SimpleTestCase):
+    CATALOG = [
+        ('shop', 'Связной'),
+        ('categories', [{'id': 1, 'name': 'Смартфоны'}]),
+        ('goods', {'id': 1, 'category': 1, 'model': 'a-1', 'name': 'Телефон',
+                   'price': 99.5, 'price_rrc': 120, 'quantity': 10,
+                   'parameters': {'Цвет': 'чёрный'}}),
+        ('goods', {'id': 2, 'category': 1, 'model': 'a-2', 'name': 'Чехол',
+                   'price': 1e3, 'price_rrc': 1500, 'quantity': 0,
+                   'parameters': {}}),
+    ]
+    JSON = ('{"shop": "Связной", '
+            '"categories": [{"id": 1, "name": "Смартфоны"}], '
+            '"goods": [{"id": 1, "category": 1, "model": "a-1", '
+            '"name": "Телефон", "price": 99.5, "price_rrc": 120, '
+            '"quantity": 10, "parameters": {"Цвет": "чёрный"}}, '
+            '{"id": 2, "category": 1, "model": "a-2", "name": "Чехол", '
+            '"price": 1e3, "price_rrc": 1500, "quantity": 0, '
+            '"parameters": {}}]}')
+
+    def parse(self, format, text):
+        return list(PARSERS[format](io.BytesIO(text.encode())))
+
+    def test_yaml(self):
+        text = yaml.dump(dict(
+            [*self.CATALOG[:2],
+             ('goods', [item for key, item in self.CATALOG[2:]])]),
+            allow_unicode=True, sort_keys=False)
+
+        self.assertEqual(self.parse('yaml', text), self.CATALOG)
+
+    def test_json(self):
+        self.assertEqual(self.parse('json', self.JSON), self.CATALOG)
+        self.assertEqual(self.parse('json', '{"goods": []}'), [])
+        self.assertEqual(self.parse('json', ' {} '), [])
+
+    def test_json_split_at_any_chunk_boundary(self):
+        # Куски по несколько байт режут числа, строки и кириллицу
+        for size in (1, 2, 3, 7):
+            with self.subTest(size=size), \
+                    mock.patch('backend.parsers.READ_SIZE', size):
+                self.assertEqual(self.parse('json', self.JSON),
+                                 self.CATALOG)
+
+    def test_ndjson(self):
+        text = '\n'.join(
+            [json.dumps(dict(self.CATALOG[:2]), ensure_ascii=False), '',
+             *(json.dumps(item, ensure_ascii=False)
+               for key, item in self.CATALOG[2:])])
+
+        self.assertEqual(self.parse('ndjson', text), self.CATALOG)
+
+    def test_csv(self):
+        text = ('id,category,category_name,model,name,price,price_rrc,'
+                'quantity,shop,param:Цвет\r\n'
+                '1,1,Смартфоны,a-1,Телефон,99.5,120,10,Связной,чёрный\r\n'
+                '2,1,Смартфоны,,Чехол,1000,1500,0,Связной,\r\n')
+
+        self.assertEqual(self.parse('csv', text), [
+            ('shop', 'Связной'),
+            ('categories', [{'id': 1, 'name': 'Смартфоны'}]),
+            ('goods', {'id': 1, 'category': 1, 'model': 'a-1',
+                       'name': 'Телефон', 'price': '99.5',
+                       'price_rrc': '120', 'quantity': 10,
+                       'parameters': {'Цвет': 'чёрный'}}),
+            ('goods', {'id': 2, 'category': 1, 'model': None,
+                       'name': 'Чехол', 'price': '1000',
+                       'price_rrc': '1500', 'quantity': 0,
+                       'parameters': {}}),
+        ])
+
+    def test_malformed_input(self):
+        for format, text in [
+                ('yaml', '- shop'),
+                ('yaml', 'shop: [Связной'),
+                ('json', '[]'),
+                ('json', '{"goods": [1 2 3]}'),
+                ('json', '{"goods": [1, 2,]}'),
+                ('json', '{"shop": "Связной" "goods": []}'),
+                ('json', '{"shop": "Связной"'),
+                ('json', '{"shop": "Связной"} {"shop": "Евросеть"}'),
+                ('json', '{"shop": "Связной"} garbage'),
+                ('ndjson', '{"id": 1}\n{"id": 2'),
+                ('csv', 'id,category,name,price,price_rrc,quantity\r\n'
+                        '1,смартфоны,Телефон,1,1,1\r\n')]:
+            with self.subTest(format=format, text=text), \
+                    self.assertRaises((ValueError, yaml.YAMLError)):
+                self.parse(format, text)
+
+
+# Параллельный импорт: задачи Celery выполняются сразу в этом процессе
+class ParallelImportTest(TestCase):
+
+    def setUp(self):
+        eager = {'task_always_eager': True, 'task_eager_propagates': True}
+        self.addCleanup(app.conf.update,
+                        {name: app.conf[name] for name in eager})
+        app.conf.update(eager)
+        self.user = User.objects.create_user('shop@example.com', 'pass',
+                                             type='shop')
+        self.shop = Shop.objects.create(name='Связной', user=self.user)
+
+    def start_import(self, goods, chunk_size=2):
+        job = ImportJob.objects.create(user=self.user,
+                                       url='http://example.com/shop.yaml')
+        importer = ParallelCatalogImporter(
+            self.shop, {'import_hash': str(job.id)},
+            progress=ImportProgress(job.id))
+        importer.add_categories([{'id': 1, 'name': 'Смартфоны'}])
+        for start in range(0, len(goods), chunk_size):
+            importer.add_goods([dict(item) for item in
+                                goods[start:start + chunk_size]])
+        return importer, job
+
+    def run_import(self, goods, chunk_size=2):
+        importer, job = self.start_import(goods, chunk_size)
+        result = importer.finish()
+        job.refresh_from_db()
+        return result, job
+
+    def test_chunks_publish_and_finish(self):
+        result, job = self.run_import([goods_item(number)
+                                       for number in range(1, 6)])
+
+        self.assertEqual(result, {'chunks': 3})
+        self.assertEqual((job.state, job.chunks_total, job.chunks_done),
+                         ('done', 3, 3))
+        self.assertEqual((job.goods_processed, job.inserted, job.deleted),
+                         (5, 5, 0))
+        self.assertEqual(CatalogEntry.objects.count(), 5)
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.catalog_version, 1)
+        self.assertEqual(self.shop.import_hash, str(job.id))
+        self.assertFalse(StagedProductInfo.objects.exists())
+
+        _, job = self.run_import([goods_item(1, price=200), goods_item(2),
+                                  goods_item(2), goods_item(4)])
+
+        self.assertEqual((job.state, job.inserted, job.updated,
+                          job.deleted), ('done', 0, 1, 2))
+        self.assertEqual(
+            sorted(ProductInfo.objects.values_list('external_id',
+                                                   flat=True)), [1, 2, 4])
+
+    def test_chunks_are_not_published_before_finish(self):
+        import_goods(self.shop, [goods_item(1)])
+
+        importer, job = self.start_import([goods_item(1, price=300),
+                                           goods_item(2), goods_item(3)])
+
+        self.assertEqual(StagedProductInfo.objects.filter(
+            token=importer.token).count(), 3)
+        self.assertEqual(list(ProductInfo.objects.values_list(
+            'external_id', 'price')), [(1, 100)])
+        self.assertEqual(CatalogEntry.objects.count(), 1)
+
+        importer.finish()
+        self.assertEqual(sorted(ProductInfo.objects.values_list(
+            'external_id', 'price')), [(1, 300), (2, 100), (3, 100)])
+
+    def test_last_counted_chunk_starts_finish(self):
+        job = ImportJob.objects.create(user=self.user, url='http://x.ru/')
+        importer = ParallelCatalogImporter(self.shop,
+                                           progress=ImportProgress(job.id))
+
+        self.assertFalse(importer.count_chunks(done=1))
+        self.assertFalse(importer.count_chunks(total=2))
+        self.assertTrue(importer.count_chunks(done=1))
+
+    def test_failed_chunk_fails_job(self):
+        with mock.patch.object(CatalogImporter, 'stage',
+                               side_effect=ValueError('ошибка')):
+            with self.assertRaises(ValueError):
+                self.run_import([goods_item(1), goods_item(2)])
+
+        job = ImportJob.objects.get()
+        self.assertEqual((job.state, job.error), ('failed', 'ошибка'))
+        self.assertIsNone(job.chunks_total)
+        self.assertFalse(StagedProductInfo.objects.exists())
+
+    def test_failed_finish_keeps_published_catalog(self):
+        import_goods(self.shop, [goods_item(1), goods_item(2)])
+
+        with mock.patch.object(CatalogImporter, 'remove_stale',
+                               side_effect=ValueError('ошибка')):
+            with self.assertRaises(ValueError):
+                self.run_import([goods_item(1, price=300), goods_item(3),
+                                 goods_item(4)])
+
+        job = ImportJob.objects.get()
+        self.assertEqual((job.state, job.error), ('failed', 'ошибка'))
+        self.assertEqual(sorted(ProductInfo.objects.values_list(
+            'external_id', 'price')), [(1, 100), (2, 100)])
+        self.assertEqual(CatalogEntry.objects.count(), 2)
+        self.assertFalse(StagedProductInfo.objects.exists())
+
+
+# Ход задачи импорта
+class ImportJobProgressTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('shop@example.com', 'pass',
+                                             type='shop')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_job_id_must_be_number(self):
+        response = self.client.get(reverse('partner_update_status'),
+                                   {'job_id': 'abc'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.data['status'])
+
+    def test_import_url_is_validated(self):
+        for url in ['shop.yaml', 'ftp://example.com/shop.yaml',
+                    'https://example.com/' + 'a' * 490 + '.yaml',
+                    ['https://example.com/shop.yaml'], 42]:
+            with self.subTest(url=url):
+                response = self.client.post(reverse('partner_update'),
+                                            {'url': url}, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.data['status'])
+        self.assertFalse(ImportJob.objects.exists())
+
+        url = 'https://example.com/' + 'a' * 470 + '.yaml'
+        with mock.patch('backend.views.do_import') as do_import:
+            response = self.client.post(reverse('partner_update'),
+                                        {'url': url}, format='json')
+
+        job = ImportJob.objects.get()
+        self.assertEqual(response.data['job_id'], job.id)
+        self.assertEqual(job.url, url)
+        do_import.delay.assert_called_once_with(url, self.user.id, job.id,
+                                                None)
+
+    def test_progress_is_estimated_while_reading(self):
+        job = ImportJob(bytes_total=1000, bytes_read=250, goods_read=50,
+                        goods_processed=40)
+
+        self.assertEqual(ImportJobSerializer(job).data['progress'], 0.2)
+
+        job.goods_total, job.goods_processed = 200, 150
+        self.assertEqual(ImportJobSerializer(job).data['progress'], 0.75)
+
+    def test_import_records_bytes_read(self):
+        job = ImportJob.objects.create(user=self.user, url='http://x.ru/')
+        seen = []
+        save = ImportProgress.save
+
+        def record(progress, **fields):
+            save(progress, **fields)
+            seen.append(ImportJobSerializer(
+                ImportJob.objects.get(id=job.id)).data['progress'])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'shop.yaml')
+            write_catalog(path, 3000, parameters=1)
+            with mock.patch.object(ImportProgress, 'save', record):
+                import_file(path, self.user.id, batch_size=500,
+                            progress=ImportProgress(job.id))
+            size = os.path.getsize(path)
+
+        job.refresh_from_db()
+        self.assertEqual((job.bytes_total, job.goods_read, job.state),
+                         (size, 3000, 'done'))
+        self.assertGreater(job.bytes_read, size // 2)
+        running = [value for value in seen[:-2] if value is not None]
+        self.assertGreater(len(running), 3)
+        self.assertLess(running[0], 0.5)
+        self.assertEqual(running, sorted(running))
+
+
+# Фильтры списка товаров читают витрину по индексам
+class ProductFilterPlanTest(TestCase):
+    FILTERS = {
+        'category': {'category': '2'},
+        'shop': {'shop': None},
+        'price': {'price_min': '100', 'price_max': '101'},
+        'in_stock': {'in_stock': 'true'},
+        'accepting_orders': {'accepting_orders': 'true'},
+    }
+    # Индексы фильтров от самого избирательного к наименее избирательному:
+    # план должен читать индекс первого фильтра из запроса
+    INDEXES = {
+        'price': 'catalog_price_idx',
+        'category': 'catalog_category_idx',
+        'shop': 'catalog_shop_idx',
+        'in_stock': 'catalog_in_stock_idx',
+        'accepting_orders': 'catalog_accepting_idx',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        # 100 000 предложений 50 магазинов в 1000 категориях, как в
+        # бенчмарке импорта. Треть позиций не в наличии, 5 магазинов
+        # не принимают заказы
+        Category.objects.bulk_create(
+            [Category(id=number, name=f'Категория {number}')
+             for number in range(1, 1001)])
+        shops = Shop.objects.bulk_create(
+            [Shop(name=f'Магазин {number}', accepting_orders=number >= 5)
+             for number in range(50)])
+        products = Product.objects.bulk_create(
+            [Product(name=f'Товар {number}', category_id=number + 1)
+             for number in range(1000)])
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO backend_productinfo
+                    (product_id, shop_id, model, quantity, price, price_rrc,
+                     external_id, archived, content_hash)
+                SELECT (%(products)s::int[])[n %% 1000 + 1],
+                       (%(shops)s::int[])[(n - 1) / 2000 + 1], '',
+                       CASE WHEN n %% 3 = 0 THEN 0 ELSE n %% 20 + 1 END,
+                       n * 7919 %% 100000 + 1, n * 7919 %% 100000 + 1,
+                       n, false, ''
+                FROM generate_series(1, 100000) AS n
+            """, {'products': [product.id for product in products],
+                  'shops': [shop.id for shop in shops]})
+            # Поисковые поля фильтрам не нужны, витрина собирается без них
+            cursor.execute("""
+                INSERT INTO backend_catalogentry
+                    (product_info_id, product_id, product_name, category_id,
+                     category_name, shop_id, shop_name, accepting_orders,
+                     model, quantity, price, price_rrc, parameters,
+                     search_document)
+                SELECT info.id, product.id, product.name, category.id,
+                       category.name, shop.id, shop.name,
+                       shop.accepting_orders, info.model, info.quantity,
+                       info.price, info.price_rrc, '{}', ''
+                FROM backend_productinfo AS info
+                JOIN backend_product AS product
+                    ON product.id = info.product_id
+                JOIN backend_category AS category
+                    ON category.id = product.category_id
+                JOIN backend_shop AS shop ON shop.id = info.shop_id
+            """)
+            # Статистика по всем строкам, а не по случайной выборке,
+            # чтобы план не менялся от запуска к запуску
+            cursor.execute('SET default_statistics_target = 1000')
+            cursor.execute('ANALYZE backend_catalogentry')
+            cursor.execute('RESET default_statistics_target')
+        cls.FILTERS = {**cls.FILTERS, 'shop': {'shop': str(shops[7].id)}}
+
+    def plan(self, names):
+        params = {}
+        for name in names:
+            params.update(self.FILTERS[name])
+        products = filter_products(catalog_queryset(), params).order_by(
+            ProductCursorPagination.ordering)
+        return products[:ProductCursorPagination.page_size + 1].explain()
+
+    def test_filters_use_index_of_most_selective_filter(self):
+        for size in range(1, len(self.FILTERS) + 1):
+            for names in itertools.combinations(self.FILTERS, size):
+                index = next(index for name, index in self.INDEXES.items()
+                             if name in names)
+                with self.subTest(filters=names):
+                    plan = self.plan(names)
+                    self.assertIn(index, plan)
+                    self.assertNotIn('Seq Scan', plan)
+
+
+# Поиск по витрине: слова запроса и опечатки
+class ProductSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        shop = Shop.objects.create(name='Связной')
+        import_goods(shop, [
+            goods_item(1, name='Смартфон Samsung Galaxy', category=1),
+            goods_item(2, name='Наушники Sony', category=2),
+            goods_item(3, name='Чайник Bosch', category=3)], [
+            {'id': 1, 'name': 'Телефоны'},
+            {'id': 2, 'name': 'Аудио'},
+            {'id': 3, 'name': 'Кухня'}])
+        cls.phone = ProductInfo.objects.get(external_id=1)
+
+    def search(self, text):
+        response = APIClient().get(reverse('products_search'), {'q': text})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_misspelled_query_finds_product(self):
+        for text in ['смартфоны', 'смартфн', 'Galaxi']:
+            with self.subTest(q=text):
+                self.assertEqual(self.search(text), [self.phone.id])
+
+    def test_words_and_typos_use_both_gin_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE backend_catalogentry')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = search_products(catalog_queryset(), 'смартфн')[
+            :MAX_RESULTS].explain()
+
+        self.assertIn('BitmapOr', plan)
+        self.assertIn('Bitmap Index Scan on catalog_search_idx', plan)
+        self.assertIn('Bitmap Index Scan on catalog_search_trgm_idx', plan)
+        self.assertNotIn('Seq Scan on backend_catalogentry', plan)
+
+
+# Добавление списка товаров в корзину
+class BasketTest(TestCase):
+
+    def setUp(self):
+        shop = Shop.objects.create(name='Связной')
+        import_goods(shop, [goods_item(1), goods_item(2), goods_item(3)])
+        self.offers = dict(ProductInfo.objects.values_list(
+            'external_id', 'id'))
+        self.buyer = User.objects.create_user('buyer@example.com', 'pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def add(self, *lines):
+        return self.client.post(reverse('basket'), {'items': [
+            {'product_info_id': product, 'quantity': quantity}
+            for product, quantity in lines]}, format='json')
+
+    def basket_lines(self):
+        return dict(OrderItem.objects.filter(
+            order__user=self.buyer, order__status='basket').values_list(
+            'product_id', 'quantity'))
+
+    def test_repeated_product_is_merged(self):
+        response = self.add((self.offers[1], 1), (self.offers[2], 2),
+                            (self.offers[1], 3))
+
+        self.assertEqual(response.data, {'status': True, 'lines': 2})
+        self.assertEqual(self.basket_lines(),
+                         {self.offers[1]: 4, self.offers[2]: 2})
+
+    def test_repeated_add_increments_line(self):
+        self.add((self.offers[1], 1))
+        line = OrderItem.objects.get()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.add((self.offers[1], 2), (self.offers[3], 1))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.basket_lines(),
+                         {self.offers[1]: 3, self.offers[3]: 1})
+        self.assertEqual(OrderItem.objects.get(
+            product_id=self.offers[1]).id, line.id)
+        inserts = [query['sql'] for query in queries.captured_queries
+                   if 'INSERT INTO backend_orderitem' in query['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assertIn('unnest', inserts[0])
+        self.assertIn('ON CONFLICT', inserts[0])
+
+    def test_unknown_product_rejects_request(self):
+        self.add((self.offers[1], 1))
+        unknown = max(self.offers.values()) + 100
+
+        response = self.add((self.offers[1], 1), (self.offers[2], 1),
+                            (unknown, 1))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.data['status'])
+        self.assertIn(str(unknown), response.data['error'])
+        self.assertEqual(self.basket_lines(), {self.offers[1]: 1})
+
+    def test_malformed_body_is_rejected(self):
+        for body in [[{'product_info_id': self.offers[1], 'quantity': 1}],
+                     'items', 42, {'items': {}}, {'items': [1]}]:
+            with self.subTest(body=body):
+                response = self.client.post(reverse('basket'), body,
+                                            format='json')
+
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.data['status'])
+        self.assertEqual(self.basket_lines(), {})
+
+
+# Кеш ответов каталога до смены его версии
+class CatalogCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.shop = Shop.objects.create(name='Связной')
+        import_goods(self.shop, [goods_item(1), goods_item(2)])
+        self.client = APIClient()
+
+    def get(self, params=None):
+        return self.client.get(reverse('products'), params or {})
+
+    def test_second_request_is_served_from_cache(self):
+        miss = self.get({'category': '1', 'in_stock': 'true'})
+
+        with CaptureQueriesContext(connection) as queries:
+            hit = self.get({'in_stock': 'true', 'category': '1'})
+
+        self.assertEqual(miss['X-Cache'], 'MISS')
+        self.assertEqual(hit['X-Cache'], 'HIT')
+        self.assertEqual(hit.content, miss.content)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(self.get({'category': '2'})['X-Cache'], 'MISS')
+        self.assertEqual(cache_stats()['hits'], 1)
+        self.assertEqual(cache_stats()['misses'], 2)
+
+    def test_errors_are_not_cached(self):
+        for _ in range(2):
+            response = self.get({'price_min': 'много'})
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_import_invalidates_cache_after_commit(self):
+        before = self.get().json()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            import_goods(self.shop, [goods_item(1, price=150),
+                                     goods_item(2)])
+        # До фиксации транзакции импорта отдаётся прежний ответ
+        self.assertEqual(self.get()['X-Cache'], 'HIT')
+
+        for callback in callbacks:
+            callback()
+        response = self.get()
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertNotEqual(response.json(), before)
+        self.assertEqual(self.get()['X-Cache'], 'HIT')
+
+
+# ETag списка товаров и выгрузки магазина: повторный запрос получает 304
+class CatalogETagTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('shop@example.com', 'pass',
+                                             type='shop')
+        self.shop = Shop.objects.create(name='Связной', user=self.user)
+        import_goods(self.shop, [goods_item(1), goods_item(2)])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, name, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(reverse(name), **headers)
+
+    def test_matching_etag_gets_304(self):
+        for name in ['products', 'partner_export']:
+            with self.subTest(view=name):
+                etag = self.get(name)['ETag']
+
+                response = self.get(name, etag)
+
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(response.content, b'')
+
+    def test_catalog_change_gives_new_etag(self):
+        etags = {name: self.get(name)['ETag']
+                 for name in ['products', 'partner_export']}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            import_goods(self.shop, [goods_item(1, price=150),
+                                     goods_item(2)])
+
+        for name, etag in etags.items():
+            with self.subTest(view=name):
+                response = self.get(name, etag)
+
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+
+# Оформление заказа и отмена магазином: остатки на складе
+class CheckoutStockTest(TestCase):
+
+    def setUp(self):
+        eager = {'task_always_eager': True, 'task_eager_propagates': True}
+        self.addCleanup(app.conf.update,
+                        {name: app.conf[name] for name in eager})
+        app.conf.update(eager)
+        partner = User.objects.create_user('shop@example.com', 'pass',
+                                           type='shop')
+        self.shop = Shop.objects.create(name='Связной', user=partner)
+        import_goods(self.shop, [goods_item(1, quantity=5),
+                                 goods_item(2, quantity=1)])
+        self.offers = dict(ProductInfo.objects.values_list(
+            'external_id', 'id'))
+        self.partner = APIClient()
+        self.partner.force_authenticate(partner)
+
+        buyer = User.objects.create_user('buyer@example.com', 'pass')
+        Contact.objects.create(user=buyer, type='phone', value='+7900')
+        self.address = Contact.objects.create(user=buyer, type='address',
+                                              value='Москва')
+        self.buyer = APIClient()
+        self.buyer.force_authenticate(buyer)
+
+    def checkout(self, *lines):
+        self.buyer.post(reverse('basket'), {'items': [
+            {'product_info_id': self.offers[external_id],
+             'quantity': quantity}
+            for external_id, quantity in lines]}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.buyer.post(reverse('order-confirm'),
+                                       {'contact': self.address.id})
+        return response, Order.objects.get()
+
+    def checkout_again(self, *lines):
+        """
+        Оформление ещё одного заказа тем же покупателем.
+        """
+        Order.objects.filter(status='basket').delete()
+        self.buyer.post(reverse('basket'), {'items': [
+            {'product_info_id': self.offers[external_id],
+             'quantity': quantity}
+            for external_id, quantity in lines]}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.buyer.post(reverse('order-confirm'),
+                                   {'contact': self.address.id})
+
+    def set_state(self, order, state):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.partner.post(reverse('partner_state'),
+                                     {'order_id': order.id, 'status': state})
+
+    def stock(self):
+        return (dict(ProductInfo.objects.values_list('id', 'quantity')),
+                dict(CatalogEntry.objects.values_list('product_info_id',
+                                                      'quantity')))
+
+    def test_short_stock_rolls_back(self):
+        before = self.stock()
+
+        response, order = self.checkout((1, 2), (2, 3))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertIn(str(self.offers[2]), response.data['error'])
+        self.assertEqual((order.status, order.stock_reserved),
+                         ('basket', False))
+        self.assertEqual(self.stock(), before)
+        self.assertFalse(order.shop_totals.exists())
+
+    def test_checkout_reserves_and_bumps_versions_after_commit(self):
+        version = catalog_version()
+        self.buyer.post(reverse('basket'), {
+            'product_info_id': self.offers[1], 'quantity': 2},
+            format='json')
+
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks() as callbacks:
+            response = self.buyer.post(reverse('order-confirm'),
+                                       {'contact': self.address.id})
+
+        self.assertEqual(response.data, {'status': True})
+        order = Order.objects.get()
+        self.assertEqual((order.status, order.stock_reserved),
+                         ('new', True))
+        products, entries = self.stock()
+        self.assertEqual(products[self.offers[1]], 3)
+        self.assertEqual(entries[self.offers[1]], 3)
+        # Строка магазина в транзакции оформления не блокируется
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'UPDATE "backend_shop"' in query['sql']])
+        self.assertEqual(catalog_version(), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for callback in callbacks:
+                callback()
+
+        self.assertGreater(catalog_version(), version)
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.catalog_version, 2)
+
+    def test_stock_versions_are_bumped_once_per_delay(self):
+        self.addCleanup(cache.clear)
+        with mock.patch.object(bump_stock_versions,
+                               'apply_async') as apply_async:
+            self.checkout((1, 1))
+            self.checkout_again((1, 1))
+
+        apply_async.assert_called_once_with(
+            (self.shop.id,), countdown=settings.STOCK_VERSION_DELAY)
+        version = catalog_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_stock_versions(self.shop.id)
+
+        self.assertGreater(catalog_version(), version)
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.catalog_version, 2)
+        # После смены версий следующее изменение остатков снова планирует её
+        with mock.patch.object(bump_stock_versions,
+                               'apply_async') as apply_async:
+            self.checkout_again((2, 1))
+        apply_async.assert_called_once()
+
+    def test_export_etag_changes_after_stock_versions_bump(self):
+        self.addCleanup(cache.clear)
+        etag = self.partner.get(reverse('partner_export'))['ETag']
+
+        # Остатки изменились, но смена версий ещё не выполнена: выгрузка
+        # до STOCK_VERSION_DELAY секунд отдаётся по старому ETag
+        with mock.patch.object(bump_stock_versions,
+                               'apply_async') as apply_async:
+            self.checkout((1, 2))
+        response = self.partner.get(reverse('partner_export'),
+                                    HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_stock_versions(*apply_async.call_args.args[0])
+        response = self.partner.get(reverse('partner_export'),
+                                    HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        goods = yaml.safe_load(response.content)['goods']
+        self.assertEqual({item['id']: item['quantity'] for item in goods},
+                         {1: 3, 2: 1})
+
+    def test_totals_are_saved_at_checkout(self):
+        response, order = self.checkout((1, 2), (2, 1))
+        self.assertEqual(response.data, {'status': True})
+
+        import_goods(self.shop, [goods_item(1, price=500, quantity=5),
+                                 goods_item(2, price=700, quantity=1)])
+        self.assertEqual(ProductInfo.objects.get(
+            id=self.offers[1]).price, 500)
+
+        order.refresh_from_db()
+        self.assertEqual(order.total_sum, 300)
+        self.assertEqual(
+            dict(order.items.values_list('product_id', 'price')),
+            {self.offers[1]: 100, self.offers[2]: 100})
+        self.assertEqual(list(order.shop_totals.values_list(
+            'shop_id', 'total_sum')), [(self.shop.id, 300)])
+        orders = self.partner.get(reverse('partner_orders')).data
+        self.assertEqual(orders['results'][0]['total_sum'], '300.00')
+
+    def test_cancel_releases_stock_once(self):
+        before = self.stock()
+        _, order = self.checkout((1, 2), (2, 1))
+
+        response = self.set_state(order, 'cancelled')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(), before)
+        order.refresh_from_db()
+        self.assertFalse(order.stock_reserved)
+
+        for state in ['cancelled', 'new', 'confirmed']:
+            with self.subTest(status=state):
+                response = self.set_state(order, state)
+                self.assertEqual(response.status_code, 409)
+                self.assertEqual(self.stock(), before)
+                order.refresh_from_db()
+                self.assertEqual(order.status, 'cancelled')
+
+    def test_basket_status_cannot_be_changed(self):
+        self.buyer.post(reverse('basket'), {
+            'product_info_id': self.offers[1], 'quantity': 1},
+            format='json')
+
+        response = self.set_state(Order.objects.get(), 'new')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Order.objects.get().status, 'basket')
+
+
+# Число запросов списка заказов и корзины не зависит от их размера
+class OrderQueriesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [{'id': 1, 'name': 'Смартфоны'},
+                      {'id': 2, 'name': 'Наушники'}]
+        for name in ['Связной', 'Евросеть']:
+            import_goods(Shop.objects.create(name=name), [
+                goods_item(external_id, name=f'Товар {external_id}',
+                           category=external_id % 2 + 1, color='чёрный',
+                           memory=f'{external_id} ГБ')
+                for external_id in range(1, 11)], categories)
+        cls.offers = list(ProductInfo.objects.order_by('id'))
+
+    def setUp(self):
+        self.buyer = User.objects.create_user('buyer@example.com', 'pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def make_orders(self, orders, items, status='new'):
+        Order.objects.all().delete()
+        for number in range(orders):
+            order = Order.objects.create(user=self.buyer, status=status)
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, product=offer, shop_id=offer.shop_id,
+                          quantity=1, price=offer.price)
+                for offer in self.offers[number:number + items])
+
+    def get(self, name, queries, **params):
+        with self.assertNumQueries(queries):
+            response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_query_count_does_not_grow(self):
+        for name, status, sizes in [
+                ('my-orders', 'new', [(1, 1), (7, 12)]),
+                ('basket', 'basket', [(1, 1), (1, 20)])]:
+            for orders, items in sizes:
+                with self.subTest(view=name, orders=orders, items=items):
+                    self.make_orders(orders, items, status)
+                    data = self.get(name, 6)
+                    self.assertEqual([len(order['items'])
+                                      for order in data], [items] * orders)
+                    line = data[-1]['items'][-1]
+                    offer = self.offers[orders + items - 2]
+                    self.assertEqual(line['shop']['id'], offer.shop_id)
+                    self.assertEqual(
+                        line['product']['product_detail']['name'],
+                        offer.product.name)
+
+    def test_sparse_fields_skip_relations(self):
+        for fields, queries in [('id,status', 1),
+                                ('id,items.quantity', 2),
+                                ('id,items.product.price', 2),
+                                ('id,items.shop', 3),
+                                ('user,items.product.shop_detail', 3),
+                                ('id,items.product.product_detail', 4)]:
+            for orders, items in [(1, 1), (7, 12)]:
+                with self.subTest(fields=fields, orders=orders):
+                    self.make_orders(orders, items)
+                    data = self.get('my-orders', queries, fields=fields)
+                    self.assertEqual(len(data), orders)
+                    self.assertEqual(set(data[0]),
+                                     {field.split('.')[0]
+                                      for field in fields.split(',')})
+
+
+# Заказы магазина: страницы по убыванию id, фильтры, число запросов
+class PartnerOrdersTest(TestCase):
+    STATUSES = ['new', 'confirmed', 'sent', 'confirmed', 'cancelled',
+                'new', 'confirmed']
+
+    @classmethod
+    def setUpTestData(cls):
+        partner = User.objects.create_user('shop@example.com', 'pass',
+                                           type='shop')
+        cls.shop = Shop.objects.create(name='Связной', user=partner)
+        other = Shop.objects.create(name='Евросеть')
+        import_goods(cls.shop, [goods_item(1, price=100),
+                                goods_item(2, price=30)])
+        import_goods(other, [goods_item(1, price=500)])
+        cls.partner = partner
+        cls.buyer = User.objects.create_user('buyer@example.com', 'pass')
+        cls.offers = list(ProductInfo.objects.order_by('id'))
+        # Заказ другого магазина и корзина в списке не видны
+        cls.make_order('new', [cls.offers[2]])
+        cls.make_order('basket', [cls.offers[0]])
+
+    @classmethod
+    def make_order(cls, status, offers, day=1):
+        order = Order.objects.create(user=cls.buyer, status=status)
+        Order.objects.filter(id=order.id).update(dt=timezone.make_aware(
+            datetime(2024, 3, day, 12)))
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=offer, shop_id=offer.shop_id,
+                      quantity=2) for offer in offers)
+        update_order_totals(order.id)
+        return order.id
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.partner)
+
+    def make_orders(self, statuses):
+        return [self.make_order(status, self.offers, day=number + 1)
+                for number, status in enumerate(statuses)]
+
+    def get(self, params=None, url=None):
+        response = self.client.get(url or reverse('partner_orders'),
+                                   params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_pages_go_by_id_descending(self):
+        orders = self.make_orders(self.STATUSES)
+
+        pages = [self.get({'page_size': 3})]
+        while pages[-1]['next']:
+            pages.append(self.get(url=pages[-1]['next']))
+
+        self.assertEqual([[order['id'] for order in page['results']]
+                          for page in pages],
+                         [orders[:3:-1], orders[3:0:-1], orders[:1]])
+        # Заказ, оформленный после первой страницы, не сдвигает следующие
+        self.make_order('new', self.offers)
+        self.assertEqual([order['id'] for order in self.get(
+            url=pages[0]['next'])['results']], orders[3:0:-1])
+        previous = self.get(url=pages[1]['previous'])
+        self.assertEqual([order['id'] for order in previous['results']],
+                         orders[:3:-1])
+        # Сумма заказа - только по позициям этого магазина
+        self.assertEqual(pages[0]['results'][0]['total_sum'], '260.00')
+
+    def test_filters(self):
+        orders = self.make_orders(self.STATUSES)
+
+        for params, expected in [
+                ({'status': 'confirmed'}, [orders[6], orders[3], orders[1]]),
+                ({'date_from': '2024-03-03', 'date_to': '2024-03-04'},
+                 [orders[3], orders[2]]),
+                ({'status': 'new', 'date_to': '2024-03-05'}, [orders[0]]),
+                ({'date_from': '2024-03-08'}, [])]:
+            with self.subTest(params=params):
+                self.assertEqual([order['id'] for order in
+                                  self.get(params)['results']], expected)
+
+        for params in [{'status': 'basket'}, {'status': 'unknown'},
+                       {'date_from': '03.03.2024'}]:
+            with self.subTest(params=params):
+                response = self.client.get(reverse('partner_orders'),
+                                           params)
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.data['status'])
+
+    def test_query_count_does_not_grow(self):
+        for statuses in [['new'], self.STATUSES * 3]:
+            with self.subTest(orders=len(statuses)):
+                Order.objects.filter(
+                    shop_totals__shop=self.shop).exclude(
+                    status='basket').delete()
+                self.make_orders(statuses)
+                with self.assertNumQueries(7):
+                    data = self.get()
+                self.assertEqual(len(data['results']), len(statuses))
@@ -3,14 +3,24 @@ from django.contrib import admin
 from backend.views import PartnerExportView, PartnerOrdersView, PartnerState, \
     RegisterView, ConfirmEmailView, LoginView, ProductView, BasketView, \
     ContactView, OrderListView, ConfirmOrderView, PartnerUpdate, \
-    PartnerOrderAvailableView
+    PartnerOrderAvailableView, ImportJobView, ProductSearchView, \
+    CatalogCacheView, ProductDumpView, ProductFacetsView
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('confirm-email/', ConfirmEmailView.as_view(), name='confirm-email'),
     path('partner/update/', PartnerUpdate.as_view(), name='partner_update'),
+    path('partner/update/status/', ImportJobView.as_view(),
+         name='partner_update_status'),
     path('login/', LoginView.as_view(), name='login'),
     path('product-list/', ProductView.as_view(), name='products'),
+    path('products/search/', ProductSearchView.as_view(),
+         name='products_search'),
+    path('products/cache/', CatalogCacheView.as_view(),
+         name='products_cache'),
+    path('products/dump/', ProductDumpView.as_view(), name='products_dump'),
+    path('products/facets/', ProductFacetsView.as_view(),
+         name='products_facets'),
     path('basket/', BasketView.as_view(), name='basket'),
     path('contacts/', ContactView.as_view(), name='contacts'),
     path('orders/my/', OrderListView.as_view(), name='my-orders'),
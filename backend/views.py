@@ -1,20 +1,40 @@
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.authtoken.models import Token
 import yaml
 from .serializers import ContactSerializer, OrderSerializer, \
-    ProductInfoSerializer, ShopSerializer
+    ShopSerializer, ImportJobSerializer, CatalogEntrySerializer, \
+    ProductInfoSerializer, catalog_context, catalog_queryset, \
+    with_order_details, fields_shape, parse_fields
 from .models import ConfirmEmailToken, Contact, Order, OrderItem, \
-    ProductInfo, Shop, User
+    ProductInfo, Shop, User, ImportJob, CatalogEntry
 from backend.signals import new_user_registered, email_confirmed, \
     new_order_status
 from django.contrib.auth import authenticate
-from backend.tasks import do_import
-from django.db.models import Sum, F, ExpressionWrapper, DecimalField
-from django.http import HttpResponse
+from backend.tasks import do_import, do_parallel_import
+from backend.parsers import PARSERS
+from backend.pagination import ProductCursorPagination, \
+    OrderCursorPagination
+from backend.search import search_products, MAX_RESULTS
+from backend.facets import catalog_facets
+from backend.basket import parse_lines, add_to_basket
+from backend.stock import confirm_order, release_stock
+from backend.catalog import refresh_shop_entries
+from backend.cache import cache_catalog_response, cache_stats, catalog_etag
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db.models import F
+from django.utils import timezone
+from django.http import HttpResponse, StreamingHttpResponse
+from itertools import islice
+from rest_framework.utils.encoders import JSONEncoder
 
 
 # Реализация импорта товаров
@@ -31,8 +51,59 @@ class PartnerUpdate(APIView):
             return Response(
                 {'status': False, 'error': 'Не указан url'},
                 status=status.HTTP_400_BAD_REQUEST)
-        do_import.delay(url, request.user.id)
-        return Response({'status': True, 'message': 'Импорт запущен в фоне'})
+        max_length = ImportJob._meta.get_field('url').max_length
+        try:
+            if not isinstance(url, str) or len(url) > max_length:
+                raise ValidationError('')
+            URLValidator(schemes=['http', 'https'])(url)
+        except ValidationError:
+            return Response(
+                {'status': False,
+                 'error': f'url должен быть ссылкой http(s) '
+                          f'не длиннее {max_length} символов'},
+                status=status.HTTP_400_BAD_REQUEST)
+        catalog_format = request.data.get('format')
+        if catalog_format and catalog_format not in PARSERS:
+            return Response(
+                {'status': False,
+                 'error': f'Формат должен быть одним из: '
+                          f'{", ".join(PARSERS)}'},
+                status=status.HTTP_400_BAD_REQUEST)
+        job = ImportJob.objects.create(user=request.user, url=url)
+        if request.data.get('parallel'):
+            do_parallel_import.delay(url, request.user.id, job.id,
+                                     catalog_format)
+        else:
+            do_import.delay(url, request.user.id, job.id, catalog_format)
+        return Response({'status': True, 'message': 'Импорт запущен в фоне',
+                         'job_id': job.id})
+
+
+# Состояние задачи импорта
+class ImportJobView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if request.user.type != 'shop':
+            return Response(
+                {'status': False, 'error': 'Только для магазинов'},
+                status=status.HTTP_403_FORBIDDEN)
+        jobs = ImportJob.objects.filter(user=request.user)
+        job_id = request.query_params.get('job_id')
+        if job_id:
+            try:
+                job_id = int(job_id)
+            except ValueError:
+                return Response(
+                    {'status': False, 'error': 'job_id должен быть числом'},
+                    status=status.HTTP_400_BAD_REQUEST)
+        job = jobs.filter(id=job_id).first() if job_id else \
+            jobs.order_by('-id').first()
+        if job is None:
+            return Response(
+                {'status': False, 'error': 'Задача импорта не найдена'},
+                status=status.HTTP_404_NOT_FOUND)
+        return Response(ImportJobSerializer(job).data)
 
 
 # Регистрация
@@ -127,58 +198,234 @@ class ConfirmEmailView(APIView):
              'errors': 'Не указаны все необходимые аргументы'})
 
 
-# Список товаров
+def to_price(value):
+    price = Decimal(value)
+    if not price.is_finite():
+        raise ValueError(value)
+    return price
+
+
+# Фильтры списка товаров: параметр запроса -> (поле, преобразование)
+PRODUCT_FILTERS = {
+    'category': ('category_id', int),
+    'shop': ('shop_id', int),
+    'price_min': ('price__gte', to_price),
+    'price_max': ('price__lte', to_price),
+}
+TRUE_VALUES = ('1', 'true', 'yes')
+FALSE_VALUES = ('0', 'false', 'no')
+
+
+def requested_fields(request, serializer_class):
+    """
+    Выборка полей ответа из ?fields=id,price,product_detail.name
+    (см. parse_fields). При неизвестном поле выбрасывает ValueError.
+    """
+    return parse_fields(request.query_params.get('fields'),
+                        fields_shape(serializer_class))
+
+
+def filter_products(queryset, params):
+    """
+    Применяет фильтры из параметров запроса.
+    При некорректном значении выбрасывает ValueError.
+    """
+    conditions = {}
+    for name, (lookup, cast) in PRODUCT_FILTERS.items():
+        value = params.get(name)
+        if value in (None, ''):
+            continue
+        try:
+            conditions[lookup] = cast(value)
+        except (ValueError, ArithmeticError):
+            raise ValueError(f'Некорректное значение фильтра {name}')
+
+    for name in ('in_stock', 'accepting_orders'):
+        value = params.get(name, '').lower()
+        if not value:
+            continue
+        if value not in TRUE_VALUES + FALSE_VALUES:
+            raise ValueError(f'Некорректное значение фильтра {name}')
+        flag = value in TRUE_VALUES
+        if name == 'in_stock':
+            conditions['quantity__gt' if flag else 'quantity'] = 0
+        else:
+            conditions['accepting_orders'] = flag
+    return queryset.filter(**conditions)
+
+
+# Список товаров постранично, с курсорами next/previous.
+# Фильтры: category, shop, price_min, price_max, in_stock, accepting_orders.
+# ?fields= ограничивает поля ответа и читаемые столбцы.
+# Читает витрину каталога CatalogEntry без соединения таблиц.
+# Ответы кешируются до смены версии каталога
 class ProductView(APIView):
+    # Список общий для всех, токен не нужен и не проверяется
+    authentication_classes = []
+
+    @method_decorator(condition(etag_func=catalog_etag))
+    @cache_catalog_response
     def get(self, request):
-        products = ProductInfo.objects.select_related('product', 'shop').all()
-        serializer = ProductInfoSerializer(products, many=True)
-        return Response(serializer.data)
+        try:
+            fields = requested_fields(request, ProductInfoSerializer)
+            products = filter_products(catalog_queryset(fields),
+                                       request.query_params)
+        except ValueError as e:
+            return Response({'status': False, 'error': str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        paginator = ProductCursorPagination()
+        page = paginator.paginate_queryset(products, request, view=self)
+        serializer = CatalogEntrySerializer(
+            page, many=True, context=catalog_context(page, fields))
+        return paginator.get_paginated_response(serializer.data)
+
+
+# Сколько строк витрины читается с серверного курсора за раз
+# при потоковой выгрузке
+STREAM_CHUNK_SIZE = 2000
+
+
+def stream_catalog(entries, ndjson=False, fields=None):
+    """
+    Отдаёт строки витрины в виде JSON-массива или NDJSON по мере чтения
+    с серверного курсора. В памяти одновременно находится одна пачка.
+    """
+    encoder = JSONEncoder(ensure_ascii=False)
+    entries = entries.iterator(chunk_size=STREAM_CHUNK_SIZE)
+    separator = '\n' if ndjson else ',\n'
+    first = True
+    if not ndjson:
+        yield '[\n'
+    while True:
+        chunk = list(islice(entries, STREAM_CHUNK_SIZE))
+        if not chunk:
+            break
+        rows = CatalogEntrySerializer(
+            chunk, many=True, context=catalog_context(chunk, fields)).data
+        text = separator.join(encoder.encode(row) for row in rows)
+        if ndjson:
+            yield text + '\n'
+        else:
+            yield text if first else separator + text
+        first = False
+    if not ndjson:
+        yield '\n]\n'
 
 
-# Корзина (просмотр, добавление, удаление)
-class BasketView(APIView):
-    permission_classes = [IsAuthenticated]
+# Полная выгрузка каталога потоком: JSON-массив или NDJSON (?output=ndjson).
+# Принимает те же фильтры, что и список товаров
+class ProductDumpView(APIView):
+    authentication_classes = []
 
+    @method_decorator(condition(etag_func=catalog_etag))
     def get(self, request):
-        basket = Order.objects.filter(
-            user=request.user,
-            status='basket').prefetch_related('items')
-        return Response(OrderSerializer(basket, many=True).data)
-
-    def post(self, request):
-        product_info_id = request.data.get('product_info_id')
-        quantity = request.data.get('quantity')
-        if not product_info_id or not quantity:
+        output = request.query_params.get('output', 'json')
+        if output not in ('json', 'ndjson'):
             return Response(
                 {'status': False,
-                 'error': 'product_info_id и quantity обязательны'},
+                 'error': 'Параметр output должен быть json или ndjson'},
                 status=status.HTTP_400_BAD_REQUEST)
-
         try:
-            quantity = int(quantity)
-            if quantity <= 0:
-                raise ValueError
-        except ValueError:
+            fields = requested_fields(request, ProductInfoSerializer)
+            products = filter_products(catalog_queryset(fields),
+                                       request.query_params)
+        except ValueError as e:
+            return Response({'status': False, 'error': str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        ndjson = output == 'ndjson'
+        return StreamingHttpResponse(
+            stream_catalog(products.order_by('pk'), ndjson, fields),
+            content_type='application/x-ndjson' if ndjson
+            else 'application/json')
+
+
+# Поиск товаров по названию, модели, категории и параметрам.
+# Принимает те же фильтры, что и список товаров
+class ProductSearchView(APIView):
+    authentication_classes = []
+
+    @method_decorator(condition(etag_func=catalog_etag))
+    @cache_catalog_response
+    def get(self, request):
+        text = request.query_params.get('q', '').strip()
+        if not text:
             return Response(
-                {'status': False,
-                 'error': 'Количество должно быть положительным числом'},
+                {'status': False, 'error': 'Не указан поисковый запрос'},
                 status=status.HTTP_400_BAD_REQUEST)
+        try:
+            fields = requested_fields(request, ProductInfoSerializer)
+            products = filter_products(catalog_queryset(fields),
+                                       request.query_params)
+            limit = int(request.query_params.get(
+                'page_size', settings.PRODUCTS_PAGE_SIZE))
+        except ValueError as e:
+            return Response({'status': False, 'error': str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        limit = min(max(limit, 1), MAX_RESULTS)
+        products = list(search_products(products, text)[:limit])
+        serializer = CatalogEntrySerializer(
+            products, many=True, context=catalog_context(products, fields))
+        return Response({'results': serializer.data})
+
+
+# Счётчики товаров по категориям, магазинам и значениям параметров
+# для навигации по каталогу. Принимает те же фильтры, что и список товаров
+class ProductFacetsView(APIView):
+    authentication_classes = []
+
+    @method_decorator(condition(etag_func=catalog_etag))
+    @cache_catalog_response
+    def get(self, request):
+        try:
+            products = filter_products(CatalogEntry.objects.all(),
+                                       request.query_params)
+        except ValueError as e:
+            return Response({'status': False, 'error': str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(catalog_facets(products))
+
+
+# Статистика кеша каталога: версия, попадания и промахи
+class CatalogCacheView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(cache_stats())
+
+
+# Корзина (просмотр, добавление, удаление).
+# Добавлять можно списком items: [{product_info_id, quantity}, ...];
+# повторно добавленный товар увеличивает количество в своей строке
+class BasketView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            fields = requested_fields(request, OrderSerializer)
+        except ValueError as e:
+            return Response({'status': False, 'error': str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        basket = with_order_details(Order.objects.filter(
+            user=request.user,
+            status='basket'), fields)
+        return Response(OrderSerializer(
+            basket, many=True, context={'fields': fields}).data)
+
+    def post(self, request):
+        try:
+            quantities = parse_lines(request.data)
+        except ValueError as e:
+            return Response({'status': False, 'error': str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
 
         basket, _ = Order.objects.get_or_create(user=request.user,
                                                 status='basket')
         try:
-            product_info = ProductInfo.objects.get(id=product_info_id)
-        except ProductInfo.DoesNotExist:
-            return Response(
-                {'status': False, 'error': 'Продукт не найден'},
-                status=status.HTTP_400_BAD_REQUEST)
-
-        OrderItem.objects.create(
-            order=basket,
-            product=product_info,
-            shop=product_info.shop,
-            quantity=quantity)
-        return Response({'status': True})
+            add_to_basket(basket, quantities)
+        except ValueError as e:
+            return Response({'status': False, 'error': str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'status': True, 'lines': len(quantities)})
 
     def delete(self, request):
         item_id = request.data.get('item_id')
@@ -219,7 +466,8 @@ class ContactView(APIView):
         return Response({'status': True})
 
 
-# Подтверждение заказа
+# Подтверждение заказа. Остатки списываются со склада
+# (RESERVE_STOCK); если товара не хватает, заказ не оформляется
 class ConfirmOrderView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -243,8 +491,11 @@ class ConfirmOrderView(APIView):
                 'error': 'Нужно указать адрес и телефон'
             }, status=status.HTTP_400_BAD_REQUEST)
         order.contact = contact
-        order.status = 'new'
-        order.save()
+        try:
+            confirm_order(order)
+        except ValueError as e:
+            return Response({'status': False, 'error': str(e)},
+                            status=status.HTTP_409_CONFLICT)
         new_order_status.send(
             sender=self.__class__,
             order=order,
@@ -252,14 +503,22 @@ class ConfirmOrderView(APIView):
         return Response({'status': True})
 
 
-# Просмотр заказов
+# Просмотр заказов. Число запросов не зависит от количества заказов
+# и позиций (см. with_order_details)
 class OrderListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        orders = Order.objects.filter(
-            user=request.user).exclude(status='basket')
-        return Response(OrderSerializer(orders, many=True).data)
+        try:
+            fields = requested_fields(request, OrderSerializer)
+        except ValueError as e:
+            return Response({'status': False, 'error': str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        orders = with_order_details(Order.objects.filter(
+            user=request.user).exclude(status='basket').order_by('id'),
+            fields)
+        return Response(OrderSerializer(
+            orders, many=True, context={'fields': fields}).data)
 
 
 # Включать/выключать принятие заказов
@@ -279,12 +538,40 @@ class PartnerOrderAvailableView(APIView):
                             status=status.HTTP_400_BAD_REQUEST)
         shop.accepting_orders = bool(accepting)
         shop.save()
+        refresh_shop_entries(shop)
         return Response(
             {"status": "success",
              "accepting_orders": shop.accepting_orders})
 
 
-# Получение заказов магазина
+def filter_orders(queryset, params):
+    """
+    Фильтры заказов: status, date_from и date_to (YYYY-MM-DD,
+    обе границы включительно). При некорректном значении выбрасывает
+    ValueError.
+    """
+    conditions = {}
+    order_status = params.get('status')
+    if order_status:
+        if order_status not in dict(Order.STATUS_CHOICES):
+            raise ValueError('Некорректное значение фильтра status')
+        conditions['status'] = order_status
+    for name, lookup, days in (('date_from', 'dt__gte', 0),
+                               ('date_to', 'dt__lt', 1)):
+        value = params.get(name)
+        if not value:
+            continue
+        try:
+            day = date.fromisoformat(value) + timedelta(days=days)
+        except ValueError:
+            raise ValueError(f'Некорректное значение фильтра {name}')
+        conditions[lookup] = timezone.make_aware(
+            datetime.combine(day, datetime.min.time()))
+    return queryset.filter(**conditions)
+
+
+# Получение заказов магазина постранично, новые первыми.
+# Фильтры: status, date_from, date_to
 class PartnerOrdersView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -294,44 +581,38 @@ class PartnerOrdersView(APIView):
                 {'status': False, 'error': 'Только для магазинов'},
                 status=status.HTTP_403_FORBIDDEN
             )
+        shop_id = Shop.objects.filter(user=request.user).values_list(
+            'id', flat=True).first()
+        if shop_id is None:
+            return Response(
+                {'status': False, 'error': 'Магазин не найден'},
+                status=status.HTTP_404_NOT_FOUND)
 
-        # Получаем все OrderItem, относящиеся к магазину текущего пользователя
-        order_items = OrderItem.objects.filter(
-            shop__user=request.user
+        # Заказы магазина берутся из сумм по магазинам, сохранённых
+        # при оформлении: индекс (shop, order) отдаёт их уже по порядку
+        orders = Order.objects.filter(
+            shop_totals__shop_id=shop_id
         ).exclude(
-            order__status='basket'
-        ).annotate(
-            item_sum=ExpressionWrapper(
-                F('quantity') * F('product__price_rrc'),
-                output_field=DecimalField(max_digits=10, decimal_places=2)
-            )
-        )
+            status='basket'
+        ).annotate(shop_total=F('shop_totals__total_sum'))
+        try:
+            fields = requested_fields(request, OrderSerializer)
+            orders = filter_orders(orders, request.query_params)
+        except ValueError as e:
+            return Response({'status': False, 'error': str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        # Суммируем сумму по каждому заказу
-        order_sums = order_items.values('order').annotate(
-            total_sum=Sum('item_sum')
-        )
+        paginator = OrderCursorPagination()
+        page = paginator.paginate_queryset(
+            with_order_details(orders, fields), request, view=self)
 
-        order_ids = [entry['order'] for entry in order_sums]
+        # В списке магазина сумма заказа - только по его позициям
+        for order in page:
+            order.total_sum = order.shop_total
 
-        # Получаем заказы с нужными связями для сериализации
-        orders = Order.objects.filter(
-            id__in=order_ids
-        ).select_related(
-            'user'
-        ).prefetch_related(
-            'items__product__product__category',
-            'items__product__parameters__parameter',
-            'user__contacts'
-        ).distinct()
-
-        # Добавляем атрибут total_sum каждому заказу
-        sums_map = {entry['order']: entry['total_sum'] for entry in order_sums}
-        for order in orders:
-            order.total_sum = sums_map.get(order.id, 0)
-
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        serializer = OrderSerializer(page, many=True,
+                                     context={'fields': fields})
+        return paginator.get_paginated_response(serializer.data)
 
 
 # Менять статус заказа
@@ -377,8 +658,9 @@ class PartnerState(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Проверяем, что заказ относится к этому магазину
-        order_items = OrderItem.objects.filter(order_id=order_id, shop=shop)
+        # Проверяем, что заказ относится к этому магазину и оформлен
+        order_items = OrderItem.objects.filter(
+            order_id=order_id, shop=shop).exclude(order__status='basket')
         if not order_items.exists():
             return Response(
                 {'status': False,
@@ -387,13 +669,25 @@ class PartnerState(APIView):
             )
 
         order = order_items.first().order
-        order.status = new_status
         if new_status not in ALLOWED_STATUSES:
             return Response(
                 {'status': False, 'error': 'Недопустимый статус заказа'},
                 status=status.HTTP_400_BAD_REQUEST
                 )
-        order.save()
+        # Остатки отменённого заказа уже вернулись на склад, поэтому
+        # вернуть его в работу нельзя
+        if not Order.objects.filter(id=order.id).exclude(
+                status='cancelled').update(status=new_status):
+            return Response(
+                {'status': False,
+                 'error': 'Заказ отменён, его статус изменить нельзя'},
+                status=status.HTTP_409_CONFLICT
+            )
+        order.status = new_status
+
+        # При отмене списанные остатки возвращаются на склад
+        if new_status == 'cancelled':
+            release_stock(order)
 
         # Отправляем сигнал о смене статуса (если есть)
         new_order_status.send(sender=self.__class__, order=order)
@@ -403,10 +697,25 @@ class PartnerState(APIView):
                          'order_status': order.status})
 
 
-# Экспорт товаров
+def export_etag(request, *args, **kwargs):
+    """
+    ETag выгрузки магазина: номер версии его каталога,
+    который растёт с каждым импортом.
+    """
+    if request.user.type != 'shop':
+        return None
+    shop = Shop.objects.filter(user=request.user).values_list(
+        'id', 'catalog_version').first()
+    if shop is None:
+        return None
+    return f'shop-{shop[0]}-{shop[1]}'
+
+
+# Экспорт товаров. Повторный запрос с тем же ETag получает 304
 class PartnerExportView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(condition(etag_func=export_etag))
     def get(self, request):
         user = request.user
 
@@ -420,7 +729,8 @@ class PartnerExportView(APIView):
             return Response({'status': False, 'error': 'Магазин не найден'},
                             status=404)
 
-        product_infos = ProductInfo.objects.filter(shop=shop).select_related(
+        product_infos = ProductInfo.objects.filter(
+            shop=shop, archived=False).select_related(
             'product__category'
         ).prefetch_related('parameters__parameter')
 
@@ -465,6 +775,7 @@ class PartnerExportView(APIView):
             return obj
 
         cleaned_data = clean_decimals(data)
-        yaml_data = yaml.dump(cleaned_data, allow_unicode=True)
+        yaml_data = yaml.dump(cleaned_data, allow_unicode=True,
+                              sort_keys=False)
 
         return HttpResponse(yaml_data, content_type='text/yaml')
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 from decouple import config
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -39,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'django_rest_passwordreset',
@@ -91,6 +93,23 @@ DATABASES = {
     }
 }
 
+# Кеш ответов каталога. В тестах - в памяти процесса
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CACHE_URL', default='redis://redis:6379/1'),
+    }
+}
+if 'test' in sys.argv:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Сколько секунд хранится закешированный ответ каталога
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', cast=int,
+                               default=3600)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -156,5 +175,14 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ]
 }
+# Размер страницы списка товаров по умолчанию
+PRODUCTS_PAGE_SIZE = config('PRODUCTS_PAGE_SIZE', cast=int, default=50)
+# Размер страницы списка заказов магазина по умолчанию
+ORDERS_PAGE_SIZE = config('ORDERS_PAGE_SIZE', cast=int, default=50)
+# Списывать остатки со склада при оформлении заказа
+RESERVE_STOCK = config('RESERVE_STOCK', cast=bool, default=True)
+# Через сколько секунд после изменения остатков меняются версии каталога
+# магазина: кеш каталога и ETag выгрузки сбрасываются не на каждый заказ
+STOCK_VERSION_DELAY = config('STOCK_VERSION_DELAY', cast=int, default=5)
 CELERY_BROKER_URL = 'redis://redis:6379/0'
 CELERY_RESULT_BACKEND = 'redis://redis:6379/0'